@@ -1,219 +1,81 @@
 import streamlit as st
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup
 import os
-import PyPDF2
-import tempfile
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import zipfile
-import shutil
-from urllib.parse import urlparse
-from datetime import datetime
+import io
+import run_store
+import crawler
+import metrics
+import pipeline
+import render_pool
+import job_manager
+import hashlib
 import scrapping  # Import your scrapping module to use the Analyze_scrap function
 
-# Function to read company data
-def read_company_data(file_path):
-    df = pd.read_csv(file_path)
-    return df[['Company', 'Website', 'Person LinkedIn Url']].dropna()
-
-# Function to scrape the website content with timeout handling and detailed logs
-def scrape_website(url, company_name, max_retries=3, timeout=20):
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
-    retries = 0
-    start_time = time.time()
-    
-    # Initial log entry setup
-    log_entry = {
-        'Website': url,
-        'Company Name': company_name,
-        'Domain': urlparse(url).netloc,
-        'Status': None,
-        'Description': '',
-        'Retries': 0,
-        'Time of Attempt': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'Response Code': None,
-        'Response Time': None,
-        'Headers Sent': str(headers),
-        'Headers Received': '',
-        'Page Title': '',
-        'Content Length': 0,
-        'Number of Links': 0,
-        'Number of PDFs': 0,
-        'First PDF URL': '',
-        'Redirected URL': '',
-        'User-Agent': headers['User-Agent'],
-        'Cookies Sent': '',
-        'Cookies Received': '',
-    }
-
-    cookies_sent = {}
-    
-    while retries < max_retries:
-        try:
-            response = requests.get(url, headers=headers, timeout=timeout, cookies=cookies_sent)
-            log_entry['Response Code'] = response.status_code
-            log_entry['Response Time'] = round(time.time() - start_time, 2)  # in seconds
-            log_entry['Headers Received'] = str(response.headers)
-            log_entry['Cookies Received'] = str(response.cookies)
-
-            if response.status_code == 200:
-                soup = BeautifulSoup(response.text, 'html.parser')
-                text = soup.get_text(separator=' ')
-                
-                # Clean the website text: remove new lines and extra spaces
-                text = ' '.join(text.split())  # This removes extra spaces and new lines
-
-                log_entry['Page Title'] = soup.title.string if soup.title else 'N/A'
-                log_entry['Content Length'] = len(text)
-                log_entry['Number of Links'] = len(soup.find_all('a'))
-                pdf_links = [link.get('href') for link in soup.find_all('a', href=True) if link.get('href').endswith('.pdf')]
-                log_entry['Number of PDFs'] = len(pdf_links)
-                log_entry['First PDF URL'] = pdf_links[0] if pdf_links else 'N/A'
-                log_entry['Redirected URL'] = response.url if response.history else 'N/A'
-
-                log_entry['Status'] = 'Success'
-                log_entry['Description'] = 'Website scraped successfully'
-                return text, soup, log_entry
-            else:
-                log_entry['Status'] = 'Failed'
-                log_entry['Description'] = f"Received {response.status_code} response"
-        except requests.exceptions.Timeout:
-            log_entry['Status'] = 'Error'
-            log_entry['Description'] = 'Request timed out'
-            log_entry['Retries'] = retries
-        except requests.RequestException as e:
-            log_entry['Status'] = 'Error'
-            log_entry['Description'] = str(e)
-
-        retries += 1
-        log_entry['Retries'] = retries
-        time.sleep(2 ** retries)  # Exponential backoff
-
-    return "", None, log_entry
-
-# Function to extract text from PDF
-def extract_text_from_pdf(pdf_path):
-    pdf_text = ""
+# Function to count usable rows without loading the whole file
+def count_company_rows(file_path, chunksize=1000):
+    total = sum(len(chunk.dropna()) for chunk in pd.read_csv(file_path, chunksize=chunksize, usecols=pipeline.INPUT_COLUMNS))
+    if hasattr(file_path, 'seek'):
+        file_path.seek(0)
+    return total
+
+# Main function to process companies with concurrency (messages and progress go to the job when one is given)
+# (a job's LLM calls use its own key pool and its stage timings go to its own metrics)
+def process_companies(file_path, num_threads, store, max_connections=200, max_per_host=4, llm_workers=4, max_in_flight=500, chunksize=1000,
+                      max_pages=crawler.MAX_PAGES, max_crawl_bytes=crawler.MAX_CRAWL_BYTES, job=None, render_browsers=render_pool.BROWSERS):
+    if job is None:
+        return pipeline.run_pipeline(file_path, store, num_threads, max_connections, max_per_host, llm_workers, max_in_flight, chunksize,
+                                     max_pages, max_crawl_bytes, render_browsers=render_browsers, fetch_timeout=20)
+    job.set_progress(0, count_company_rows(file_path, chunksize))
+    with metrics.use(job.metrics):
+        return pipeline.run_pipeline(file_path, store, num_threads, max_connections, max_per_host, llm_workers, max_in_flight, chunksize,
+                                     max_pages, max_crawl_bytes, render_browsers=render_browsers, fetch_timeout=20,
+                                     report=job.log, progress=job.set_progress, key_pool=job.key_pool)
+
+
+# Function to get the checkpoint store of an input (run_id is its content hash); with resume a new job on
+# the same file continues an interrupted run, otherwise it starts over
+def open_run_store(run_id, resume=False, checkpoint_dir="checkpoints"):
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    return run_store.RunStore(os.path.join(checkpoint_dir, f"{run_id}.sqlite"), input_key=run_id, resume=resume)
+
+# Output files of a job, written to its own directory
+JOB_FILES = ["output_profiles.csv", "scraping_logs.csv", "stage_metrics.json"]
+
+# Function to run one GUI job in the background: process its input and save the profiles, logs and metrics
+def run_job(job, run_id, settings, resume=False):
+    store = open_run_store(run_id, resume)
+    exported = False
     try:
-        with open(pdf_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            for page in reader.pages:
-                pdf_text += page.extract_text() or ''
-    except Exception:
-        pass
-    return pdf_text
-
-# Function to scrape PDFs
-def scrape_pdfs(soup, base_url):
-    pdf_texts = []
-    if soup:
-        pdf_links = [link.get('href') for link in soup.find_all('a', href=True) if link.get('href').endswith('.pdf')]
-        for pdf_link in pdf_links:
-            if not pdf_link.startswith('http'):
-                pdf_link = base_url + pdf_link
-            try:
-                pdf_response = requests.get(pdf_link)
-                pdf_response.raise_for_status()
-                with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temp_pdf:
-                    temp_pdf.write(pdf_response.content)
-                    temp_pdf_path = temp_pdf.name
-                pdf_text = extract_text_from_pdf(temp_pdf_path)
-                pdf_texts.append(pdf_text)
-                os.remove(temp_pdf_path)
-            except requests.RequestException:
-                pass
-    return pdf_texts
-
-# Function to generate profile
-def generate_profile(company_name, url, linkedin_url, text, pdf_texts):
-    profile = {
-        "Company": company_name,
-        "Website": url,
-        "Person LinkedIn URL": linkedin_url,  # Changed to Personal LinkedIn URL
-        "Website Text": text,
-        "PDF Text": ' '.join(pdf_texts)  # Join PDF texts into a single string
-    }
-    return profile
-
-# Function to analyze scraped data with LLM
-def analyze_with_llm(profiles):
-    for profile in profiles:
-        st.write(f"Analyzing {profile['Company']} with LLM...")
-        website_analysis = scrapping.Analyze_scrap(profile['Website Text'])
-        pdf_analysis = scrapping.Analyze_scrap(profile['PDF Text'])
-        profile['Signals'] = {
-            "Website Analysis": website_analysis,
-            "PDF Analysis": pdf_analysis
-        }
-    return profiles
-
-# Main function to process companies with concurrency
-def process_companies(file_path, num_threads):
-    company_data = read_company_data(file_path)
-    profiles = []
-    logs = []  # Initialize the logs list here
-    with ThreadPoolExecutor(max_workers=num_threads) as executor:
-        futures = {executor.submit(process_company, row, logs): row for _, row in company_data.iterrows()}
-        for i, future in enumerate(as_completed(futures)):
-            row = futures[future]
-            company_name = row['Company']
-            try:
-                profile = future.result()
-                if profile:
-                    profiles.append(profile)
-            except Exception as e:
-                st.write(f"Error processing {company_name}: {e}")
-            finally:
-                st.session_state.progress_bar.progress((i + 1) / len(company_data))
-                st.write(f"{len(company_data) - (i + 1)} companies remaining")
-    
-    # After scraping, analyze the profiles with LLM
-    profiles = analyze_with_llm(profiles)
-
-    return profiles, logs
-
-# Function to process a single company
-def process_company(row, logs):  # Add logs as argument
-    url = row['Website']
-    linkedin_url = row['Person LinkedIn Url']
-    company_name = row['Company']
-
-    st.write(f"Processing {company_name} at {url}...")
-    text, soup, log_entry = scrape_website(url, company_name)  # Scraping with timeout handling and logging
-    pdf_texts = scrape_pdfs(soup, url)
-
-    # Log the entry into the logs list
-    logs.append(log_entry)  # Append the log entry to logs
-    
-    if text:
-        profile = generate_profile(company_name, url, linkedin_url, text, pdf_texts)
-        return profile
-    else:
-        st.write(f"No content found for {url}.")
-        return None
-
-
-# Function to zip the profiles and logs together
-def create_zip_file(profiles, logs):
-    # Save output files
-    output_file = "output_profiles.csv"
-    log_file = "scraping_logs.csv"
-    pd.DataFrame(profiles).to_csv(output_file, index=False)
-    pd.DataFrame(logs).to_csv(log_file, index=False)
-
-    # Create a zip file
-    zip_file = "scraping_output.zip"
-    with zipfile.ZipFile(zip_file, 'w') as zipf:
-        zipf.write(output_file)
-        zipf.write(log_file)
-
-    # Clean up the CSV files after zipping
-    os.remove(output_file)
-    os.remove(log_file)
-
-    return zip_file
+        process_companies(os.path.join(job.output_dir, "input.csv"), store=store, job=job, **settings)
+        profiles_file, logs_file, metrics_file = (os.path.join(job.output_dir, name) for name in JOB_FILES)
+        store.export_csv('profile', profiles_file)
+        store.export_csv('log', logs_file)
+        job.metrics.write(metrics_file)  # Stage metrics of this job only
+        job.log("Output files saved")
+        exported = True
+    finally:
+        if exported:
+            store.remove()  # A later upload of the same file is processed again instead of returning this run
+        else:
+            store.close()
+
+# Function to zip the output files of a finished job in memory (cached, the files do not change once it is done)
+@st.cache_data(max_entries=8)
+def zip_job_files(output_dir):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for name in JOB_FILES:
+            path = os.path.join(output_dir, name)
+            if os.path.exists(path):
+                zipf.write(path, arcname=name)
+    return buffer.getvalue()
+
+# Job manager shared by every session and rerun of the app
+@st.cache_resource
+def get_job_manager():
+    return job_manager.JobManager(root_dir="jobs", max_jobs=2)
 
 # Streamlit Interface
 st.set_page_config(page_title="Company Website Scraper and Analyzer", layout="wide")
@@ -224,31 +86,84 @@ st.sidebar.header("Please Add your gemini-1.5-flash LLM API Keys")
 num_api_keys = st.sidebar.number_input("How many API keys?", min_value=1, max_value=5, step=1, value=1)
 api_keys = [st.sidebar.text_input(f"API Key {i+1}", type="password") for i in range(num_api_keys)]
 st.sidebar.write("Stored API keys:", api_keys)
+rpm_limit = st.sidebar.number_input("Requests per Minute per Key", min_value=1, max_value=4000, step=1, value=scrapping.DEFAULT_RPM_LIMIT)
+tpm_limit = st.sidebar.number_input("Tokens per Minute per Key", min_value=1000, max_value=10000000, step=1000, value=scrapping.DEFAULT_TPM_LIMIT)
 
 # Sidebar: Number of Threads
 num_threads = st.sidebar.number_input("Number of Threads ", min_value=1, max_value=20, step=1, value=5)
 
-# Center: File Upload and Progress Bar
+# Sidebar: Connection pool limits for the async fetch engine
+max_connections = st.sidebar.number_input("Max Concurrent Requests", min_value=1, max_value=1000, step=10, value=200)
+max_per_host = st.sidebar.number_input("Max Requests per Domain", min_value=1, max_value=20, step=1, value=4)
+
+# Sidebar: Number of concurrent LLM workers
+llm_workers = st.sidebar.number_input("LLM Workers", min_value=1, max_value=20, step=1, value=4)
+
+# Sidebar: Extra pages crawled per company besides the homepage
+max_pages = st.sidebar.number_input("Pages per Company", min_value=0, max_value=20, step=1, value=crawler.MAX_PAGES)
+
+# Sidebar: Headless browsers rendering JS-heavy sites whose static text is too short (0 disables)
+render_browsers = st.sidebar.number_input("Browsers for JS Sites", min_value=0, max_value=8, step=1, value=render_pool.BROWSERS)
+
+# Sidebar: Continue an interrupted job of the same file instead of starting over (failed companies are retried)
+resume = st.sidebar.checkbox("Resume interrupted run", value=False)
+
+# Center: File Upload, job submission and live progress of this session's jobs
+jobs = get_job_manager()
+if "job_ids" not in st.session_state:
+    st.session_state.job_ids = []
+
 uploaded_file = st.file_uploader("Upload a CSV file with company data", type="csv")
-if uploaded_file:
-    if "progress_bar" not in st.session_state:
-        st.session_state.progress_bar = None
-
-    if st.button("Start Processing"):
-        st.session_state.progress_bar = st.progress(0)
-        profiles, logs = process_companies(uploaded_file, num_threads)
-        st.session_state.progress_bar.progress(1.0)
-
-        # Create a zip file containing both the profiles and logs
-        zip_file = create_zip_file(profiles, logs)
-
-        # Store the zip file path in session state
-        st.session_state.zip_file = zip_file
-
-        # Right Section: Show Output Files
-        with st.sidebar:
-            st.header("Output Files")
-            if "zip_file" in st.session_state:
-                with open(st.session_state.zip_file, "rb") as file:
-                    st.download_button("Download All Files", data=file.read(), file_name=st.session_state.zip_file)
-            st.write("Files saved to:", zip_file)
+if uploaded_file and st.button("Start Processing"):
+    content = uploaded_file.getvalue()
+    run_id = hashlib.sha256(content).hexdigest()[:16]
+
+    def save_input(job):
+        with open(os.path.join(job.output_dir, "input.csv"), "wb") as file:
+            file.write(content)
+        # The job spreads its LLM calls across the entered keys (the .env keys when none are entered) with
+        # its own quotas, so another session's job never changes them while it runs
+        job.key_pool = scrapping.KeyPool(scrapping.usable_api_keys(api_keys), rpm_limit, tpm_limit)
+
+    settings = {'num_threads': num_threads, 'max_connections': max_connections, 'max_per_host': max_per_host,
+                'llm_workers': llm_workers, 'max_pages': max_pages, 'render_browsers': render_browsers}
+    # The same file while its job is still running returns that job instead of starting over
+    job = jobs.submit(run_job, run_id, settings, resume, key=run_id, prepare=save_input)
+    if job.id not in st.session_state.job_ids:
+        st.session_state.job_ids.append(job.id)
+
+active = False
+for job_id in reversed(st.session_state.job_ids):
+    job = jobs.get(job_id)
+    if job is None:
+        continue  # The server restarted, the job's files are still in its directory
+    info = job.snapshot()
+    active = active or info['status'] in ('queued', 'running')
+    st.subheader(f"Job {info['id']}: {info['status']}")
+    st.progress(info['progress'])
+    st.write(f"{info['completed']} / {info['total']} rows in {info['elapsed']}s ({info['rows_per_min']} rows/min)")
+    if info['error']:
+        st.error(info['error'])
+    with st.expander("Messages"):
+        st.text("\n".join(info['messages'][-50:]))
+    with st.expander("Run Statistics"):
+        if job.key_pool is not None:
+            st.write("API key usage:", pd.DataFrame(job.key_pool.usage()))
+        stage_metrics = job.metrics.snapshot()
+        if stage_metrics['stages']:
+            st.write("Stage timings (s):", pd.DataFrame(stage_metrics['stages']).T)
+        st.write("Counters:", stage_metrics['counters'])
+    if info['status'] == 'done':
+        st.download_button("Download All Files", data=zip_job_files(job.output_dir), file_name=f"scraping_output_{job_id}.zip",
+                           mime="application/zip", key=f"download_{job_id}")
+        st.write("Files saved to:", job.output_dir)
+
+if st.session_state.job_ids:
+    with st.sidebar:
+        st.header("Run Statistics")
+        st.write("LLM cache (all jobs):", scrapping.get_cache_stats())
+
+# Poll the running jobs: rerun the script every few seconds while one is active
+if active and st.checkbox("Auto-refresh", value=True):
+    time.sleep(2)
+    st.rerun()
@@ -0,0 +1,347 @@
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+import pandas as pd
+
+# Headless batch runner: the input is split into work items (all rows of a domain land in the
+# same item) listed in a SQLite queue inside a run directory; worker processes on this host or on
+# any host that mounts the run directory claim items, run process_companies on them and write one
+# result set per item, and a merge step joins the results into the usual output files
+
+ROWS_PER_ITEM = 200
+LEASE_SECONDS = 600  # A claimed item whose worker stops heartbeating for this long is handed out again
+HEARTBEAT_SECONDS = 60
+MAX_ATTEMPTS = 3
+
+
+def _item_path(run_dir, item_id):
+    return os.path.join(run_dir, 'items', f'{item_id:05d}.csv')
+
+
+def _result_paths(run_dir, item_id):
+    prefix = os.path.join(run_dir, 'results', f'{item_id:05d}')
+    return {
+        'profiles': prefix + '_profiles.csv',
+        'logs': prefix + '_logs.csv',
+        'checkpoint': prefix + '_checkpoint.sqlite',
+        'metrics': prefix + '_metrics.json',
+    }
+
+
+# Work queue of a run: one row per item, claimed with a lease so items of crashed workers are retried
+class WorkQueue:
+    def __init__(self, run_dir, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.path = os.path.join(run_dir, 'queue.sqlite')
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        # WAL is not safe on network file systems, the rollback journal is used for multi-host runs
+        self.connection = sqlite3.connect(self.path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS items (id INTEGER PRIMARY KEY, rows INTEGER, status TEXT, worker TEXT, '
+            'heartbeat REAL, attempts INTEGER DEFAULT 0, error TEXT)'
+        )
+
+    def add(self, item_id, rows):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO items (id, rows, status) VALUES (?, ?, 'pending')", (item_id, rows)
+            )
+
+    # Claim the next pending item (or an item whose lease expired), returns its id or None when nothing is left
+    def claim(self, worker):
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                row = self.connection.execute(
+                    "SELECT id FROM items WHERE status = 'pending' OR (status = 'claimed' AND heartbeat < ?) ORDER BY id LIMIT 1",
+                    (time.time() - self.lease_seconds,),
+                ).fetchone()
+                if row is not None:
+                    self.connection.execute(
+                        "UPDATE items SET status = 'claimed', worker = ?, heartbeat = ?, attempts = attempts + 1 WHERE id = ?",
+                        (worker, time.time(), row[0]),
+                    )
+                self.connection.execute('COMMIT')
+            except BaseException:
+                self.connection.execute('ROLLBACK')
+                raise
+        return row[0] if row else None
+
+    def heartbeat(self, item_id, worker):
+        with self.lock:
+            self.connection.execute(
+                "UPDATE items SET heartbeat = ? WHERE id = ? AND worker = ? AND status = 'claimed'", (time.time(), item_id, worker)
+            )
+
+    def done(self, item_id):
+        with self.lock:
+            self.connection.execute("UPDATE items SET status = 'done', error = NULL WHERE id = ?", (item_id,))
+
+    # Put a failed item back in the queue, or give up on it after max_attempts
+    def fail(self, item_id, error):
+        with self.lock:
+            self.connection.execute(
+                "UPDATE items SET status = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END, error = ? WHERE id = ?",
+                (self.max_attempts, error, item_id),
+            )
+
+    # Number of items and rows per status
+    def status(self):
+        with self.lock:
+            return {status: {'items': items, 'rows': rows or 0} for status, items, rows in self.connection.execute(
+                'SELECT status, COUNT(*), SUM(rows) FROM items GROUP BY status'
+            )}
+
+    def item_ids(self, status=None):
+        with self.lock:
+            if status is None:
+                return [row[0] for row in self.connection.execute('SELECT id FROM items ORDER BY id')]
+            return [row[0] for row in self.connection.execute('SELECT id FROM items WHERE status = ? ORDER BY id', (status,))]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+# Function to split the input CSV into work items of about rows_per_item rows, streaming it in chunks;
+# rows are assigned by a stable hash of their domain so each domain is scraped by a single worker
+def split_input(file_path, run_dir, rows_per_item=ROWS_PER_ITEM, chunksize=1000):
+    import pipeline
+    import retry_policy
+
+    if os.path.exists(os.path.join(run_dir, 'queue.sqlite')):
+        raise FileExistsError(f"{run_dir} already holds a run, use 'work' to continue it or pick a new directory")
+    os.makedirs(os.path.join(run_dir, 'items'), exist_ok=True)
+    os.makedirs(os.path.join(run_dir, 'results'), exist_ok=True)
+    total_rows = sum(len(chunk.dropna()) for chunk in pd.read_csv(file_path, chunksize=chunksize, usecols=pipeline.INPUT_COLUMNS))
+    num_items = max((total_rows + rows_per_item - 1) // rows_per_item, 1)
+
+    item_rows = {}
+    for chunk in pd.read_csv(file_path, chunksize=chunksize, usecols=pipeline.INPUT_COLUMNS):
+        chunk = chunk.dropna()
+        item_ids = chunk['Website'].map(lambda url: zlib.crc32(retry_policy.normalize_domain(url).encode('utf-8')) % num_items)
+        for item_id, rows in chunk.groupby(item_ids):
+            path = _item_path(run_dir, item_id)
+            rows.to_csv(path, mode='a', index=False, header=not os.path.exists(path))
+            item_rows[item_id] = item_rows.get(item_id, 0) + len(rows)
+
+    queue = WorkQueue(run_dir)
+    for item_id, rows in sorted(item_rows.items()):
+        queue.add(int(item_id), rows)
+    queue.close()
+    print(f"Split {total_rows} rows into {len(item_rows)} work items in {run_dir}")
+    return len(item_rows)
+
+
+def _heartbeat_loop(queue, item_id, worker, stop):
+    while not stop.wait(HEARTBEAT_SECONDS):
+        queue.heartbeat(item_id, worker)
+
+
+# Function run by each worker process: claim items until the queue is empty
+def worker_main(run_dir, worker_index=0, options=None):
+    import company_app
+    import metrics
+    import scrapping
+
+    options = dict(options or {})
+    # Every worker sends its LLM calls to the same keys: it only gets its share of each key's quota,
+    # in whole requests so the shares never add up to more than the key allows
+    key_share = options.pop('key_share', 1)
+    rpm_limit = options.pop('rpm_limit', None) or scrapping.DEFAULT_RPM_LIMIT
+    tpm_limit = options.pop('tpm_limit', None) or scrapping.DEFAULT_TPM_LIMIT
+    scrapping.set_api_keys(scrapping.API_Vault, rpm_limit // key_share, tpm_limit // key_share)
+    metrics_port = options.pop('metrics_port', None) or int(os.environ.pop('METRICS_PORT', '0'))
+    if metrics_port:
+        metrics.serve(metrics_port + worker_index)  # One port per worker on this host
+    worker = f'{socket.gethostname()}:{os.getpid()}'
+    queue = WorkQueue(run_dir)
+    processed = 0
+    while True:
+        item_id = queue.claim(worker)
+        if item_id is None:
+            break
+        paths = _result_paths(run_dir, item_id)
+        print(f"[{worker}] Processing work item {item_id}")
+        metrics.registry.reset()  # The metrics file of an item covers that item only
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=_heartbeat_loop, args=(queue, item_id, worker, stop), daemon=True)
+        heartbeat.start()
+        try:
+            # Each item has its own checkpoint, a re-claimed item resumes at the domains it had not finished
+            company_app.process_companies(
+                _item_path(run_dir, item_id), paths['profiles'], paths['logs'], checkpoint_file=paths['checkpoint'],
+                metrics_file=paths['metrics'], resume=True, **options,
+            )
+        except Exception as e:
+            print(f"[{worker}] Work item {item_id} failed: {e}")
+            queue.fail(item_id, str(e))
+        else:
+            queue.done(item_id)
+            processed += 1
+        finally:
+            stop.set()
+            heartbeat.join()
+    queue.close()
+    print(f"[{worker}] No work left, processed {processed} items")
+    return processed
+
+
+# Function to get the most workers that can share the API keys: each needs at least one request per
+# minute and room for the largest prompt in its share of every key's quota
+def max_key_share(rpm_limit=None, tpm_limit=None):
+    import scrapping
+
+    rpm_limit = rpm_limit or scrapping.DEFAULT_RPM_LIMIT
+    tpm_limit = tpm_limit or scrapping.DEFAULT_TPM_LIMIT
+    return min(rpm_limit, tpm_limit // scrapping.max_prompt_tokens())
+
+
+# Function to run num_workers worker processes on this host (start the same command on other
+# hosts that mount run_dir to add more workers); the per-key quotas in options (rpm_limit, tpm_limit)
+# are split between total_workers, all workers of the run on every host (num_workers by default).
+# Without num_workers one worker per core is started, as many as the quotas allow
+def run_workers(run_dir, num_workers=None, options=None, total_workers=None):
+    options = dict(options or {})
+    max_workers = max_key_share(options.get('rpm_limit'), options.get('tpm_limit'))
+    num_workers = num_workers or max(min(os.cpu_count() or 1, max_workers), 1)
+    key_share = max(total_workers or num_workers, 1)
+    if key_share > max_workers:
+        raise ValueError(f"{key_share} workers cannot share the API keys: each needs a whole request per minute and "
+                         f"room for a full prompt in its token share, use at most {max_workers} workers or raise "
+                         f"--rpm-limit / --tpm-limit")
+    options['key_share'] = key_share
+    # Each worker parses PDFs in its own process pool, the cores are shared between them
+    options.setdefault('pdf_workers', max((os.cpu_count() or 1) // num_workers, 1))
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=worker_main, args=(run_dir, index, options), name=f'batch-worker-{index}')
+                 for index in range(num_workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    failed = [process.name for process in processes if process.exitcode != 0]
+    if failed:
+        print(f"Workers exited with an error: {', '.join(failed)}")
+
+
+def _append_csv(source, output_file, columns, chunksize=1000):
+    for chunk in pd.read_csv(source, chunksize=chunksize):
+        if columns is None:
+            columns = list(chunk.columns)
+            chunk.to_csv(output_file, index=False)
+        else:
+            chunk.reindex(columns=columns).to_csv(output_file, mode='a', index=False, header=False)
+    return columns
+
+
+def _merge_metrics(paths):
+    stages, counters = {}, {}
+    for path in paths:
+        with open(path, encoding='utf-8') as file:
+            snapshot = json.load(file)
+        for stage, summary in snapshot['stages'].items():
+            merged = stages.setdefault(stage, {'count': 0, 'total': 0.0, 'max': 0.0, 'p99 (max of items)': 0.0})
+            merged['count'] += summary['count']
+            merged['total'] += summary['total']
+            merged['max'] = max(merged['max'], summary['max'])
+            merged['p99 (max of items)'] = max(merged['p99 (max of items)'], summary['p99'])
+        for name, value in snapshot['counters'].items():
+            counters[name] = counters.get(name, 0) + value
+    for merged in stages.values():
+        merged['mean'] = round(merged['total'] / merged['count'], 4) if merged['count'] else 0
+        merged['total'] = round(merged['total'], 3)
+    return {'stages': stages, 'counters': counters}
+
+
+# Function to join the per-item profiles, logs and metrics of a run (streamed, in item order)
+def merge_results(run_dir, output_file, log_file, metrics_file=None):
+    queue = WorkQueue(run_dir)
+    status = queue.status()
+    item_ids = queue.item_ids('done')
+    queue.close()
+    unfinished = {key: value for key, value in status.items() if key != 'done'}
+    if unfinished:
+        print(f"Merging {len(item_ids)} finished items, not finished: {unfinished}")
+
+    for kind, target in (('profiles', output_file), ('logs', log_file)):
+        columns = None
+        for item_id in item_ids:
+            source = _result_paths(run_dir, item_id)[kind]
+            if os.path.exists(source) and os.path.getsize(source):
+                columns = _append_csv(source, target, columns)
+        print(f"Merged {kind} of {len(item_ids)} items into {target}" if columns else f"No {kind} to merge")
+
+    metrics_paths = [path for path in (_result_paths(run_dir, item_id)['metrics'] for item_id in item_ids) if os.path.exists(path)]
+    if metrics_paths:
+        metrics_file = metrics_file or os.path.splitext(output_file)[0] + '_metrics.json'
+        with open(metrics_file, 'w', encoding='utf-8') as file:
+            json.dump(_merge_metrics(metrics_paths), file, indent=2)
+        print(f"Merged stage metrics into {metrics_file}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded batch runner for the company scraping pipeline")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    split = commands.add_parser('split', help="Split an input CSV into work items of a new run directory")
+    split.add_argument('input')
+    split.add_argument('run_dir')
+    split.add_argument('--rows-per-item', type=int, default=ROWS_PER_ITEM)
+
+    work = commands.add_parser('work', help="Run worker processes until the queue is empty (on any host that mounts run_dir)")
+    work.add_argument('run_dir')
+
+    merge = commands.add_parser('merge', help="Join the results of finished work items")
+    merge.add_argument('run_dir')
+    merge.add_argument('--output', default='website_data.csv')
+    merge.add_argument('--logs', default='Scraping_Logs.csv')
+
+    run = commands.add_parser('run', help="split, work and merge on this host")
+    run.add_argument('input')
+    run.add_argument('run_dir')
+    run.add_argument('--rows-per-item', type=int, default=ROWS_PER_ITEM)
+    run.add_argument('--output', default='website_data.csv')
+    run.add_argument('--logs', default='Scraping_Logs.csv')
+
+    status = commands.add_parser('status', help="Show the number of items and rows per status")
+    status.add_argument('run_dir')
+
+    for command in (work, run):
+        command.add_argument('--workers', type=int,
+                             help="Worker processes on this host (default: one per core, as many as the API key quotas allow)")
+        command.add_argument('--threads', type=int, default=5, help="Scrape threads per worker")
+        command.add_argument('--llm-workers', type=int, default=4, help="LLM workers per worker")
+        command.add_argument('--metrics-port', type=int, help="Serve each worker's metrics on this port plus its index")
+        command.add_argument('--rpm-limit', type=int, help="Requests per minute per API key for the whole run")
+        command.add_argument('--tpm-limit', type=int, help="Tokens per minute per API key for the whole run")
+        command.add_argument('--total-workers', type=int,
+                             help="Workers on all hosts sharing the API keys (default --workers), each gets this share of the quotas")
+    args = parser.parse_args()
+
+    if args.command in ('split', 'run'):
+        split_input(args.input, args.run_dir, args.rows_per_item)
+    if args.command in ('work', 'run'):
+        start = time.perf_counter()
+        run_workers(args.run_dir, args.workers, {
+            'num_threads': args.threads, 'llm_workers': args.llm_workers, 'metrics_port': args.metrics_port,
+            'rpm_limit': args.rpm_limit, 'tpm_limit': args.tpm_limit,
+        }, args.total_workers)
+        print(f"Workers finished in {time.perf_counter() - start:.1f}s")
+    if args.command in ('merge', 'run'):
+        merge_results(args.run_dir, args.output, args.logs)
+    if args.command == 'status':
+        queue = WorkQueue(args.run_dir)
+        print(queue.status())
+        queue.close()
+
+
+if __name__ == '__main__':
+    main()
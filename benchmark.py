@@ -0,0 +1,316 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from aiohttp import web
+import metrics
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Offline benchmark of process_companies: synthetic company sites and PDFs are served from
+# localhost (one port per company, so every company is its own domain) and the LLM is faked
+
+WORDS = ('rocket satellite payload orbit launch engine customer platform market revenue growth team founder '
+         'product service solution partner industry technology research mission contract supply network data '
+         'cloud security analytics operations enterprise pricing investor funding expansion region').split()
+FOOTER = "Copyright 2024. All rights reserved. We use cookies to improve your experience. Privacy Policy. Terms of Use."
+SUBPAGES = ['/about', '/products', '/news', '/team', '/solutions', '/investors', '/partners', '/careers']
+
+SCENARIOS = {
+    'baseline': {},
+    'slow-sites': {'latency': 0.5, 'jitter': 0.2},
+    'flaky-sites': {'error_rate': 0.2},
+    'large-pages': {'page_kb': 500, 'subpages': 5},
+    'large-pdfs': {'pdfs': 3, 'pdf_kb': 2000},
+    'slow-llm': {'llm_latency': 3.0},
+}
+DEFAULTS = {
+    'companies': 50,
+    'num_threads': 5,
+    'llm_workers': 4,
+    'latency': 0.05,  # seconds per response
+    'jitter': 0.02,
+    'error_rate': 0.0,  # share of companies whose homepage answers 503
+    'page_kb': 20,
+    'subpages': 3,
+    'pdfs': 1,
+    'pdf_kb': 50,
+    'llm_latency': 0.5,  # seconds per LLM call, plus llm_seconds_per_1k_tokens
+    'llm_seconds_per_1k_tokens': 0.01,
+    'seed': 0,
+}
+
+
+def _sentences(rng, size_bytes):
+    parts, size = [], 0
+    while size < size_bytes:
+        sentence = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))).capitalize() + '.'
+        parts.append(sentence)
+        size += len(sentence) + 1
+    return parts
+
+
+def _pdf_escape(line):
+    return line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+# Function to build a minimal valid text PDF (Helvetica, one text line per row)
+def build_pdf(lines, lines_per_page=50):
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+    objects = {
+        1: b'<< /Type /Catalog /Pages 2 0 R >>',
+        3: b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    }
+    kids = []
+    for n, page_lines in enumerate(pages):
+        page_id, content_id = 4 + 2 * n, 5 + 2 * n
+        stream = ('BT /F1 9 Tf 40 760 Td 14 TL ' + ''.join(f'({_pdf_escape(line)}) Tj T* ' for line in page_lines) + 'ET').encode('latin-1')
+        objects[content_id] = b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream'
+        objects[page_id] = (f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+                            f'/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>').encode('latin-1')
+        kids.append(f'{page_id} 0 R')
+    objects[2] = f'<< /Type /Pages /Kids [{" ".join(kids)}] /Count {len(kids)} >>'.encode('latin-1')
+
+    pdf = bytearray(b'%PDF-1.4\n')
+    offsets = {}
+    for object_id in sorted(objects):
+        offsets[object_id] = len(pdf)
+        pdf += b'%d 0 obj\n' % object_id + objects[object_id] + b'\nendobj\n'
+    xref_offset = len(pdf)
+    size = max(objects) + 1
+    pdf += b'xref\n0 %d\n0000000000 65535 f \n' % size
+    for object_id in range(1, size):
+        pdf += b'%010d 00000 n \n' % offsets[object_id]
+    pdf += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (size, xref_offset)
+    return bytes(pdf)
+
+
+# Local stand-in for the web: one listening port per company, pages and PDFs generated from a seed
+class SyntheticWeb:
+    def __init__(self, companies, latency=0.05, jitter=0.02, error_rate=0.0, page_kb=20, subpages=3, pdfs=1, pdf_kb=50,
+                 seed=0, **_):
+        self.companies = companies
+        self.latency = latency
+        self.jitter = jitter
+        self.page_bytes = page_kb * 1024
+        self.subpages = SUBPAGES[:subpages]
+        self.pdfs = pdfs
+        self.pdf_bytes = pdf_kb * 1024
+        self.seed = seed
+        rng = random.Random(seed)
+        self.failing = set(rng.sample(range(companies), int(companies * error_rate)))
+        self.ports = {}  # port -> company index
+        self.loop = None
+        self.thread = None
+        self.runner = None
+
+    def _page(self, company, path):
+        rng = random.Random(f'{self.seed}-{company}-{path}')
+        links = ''.join(f'<a href="{subpage}">{subpage[1:].title()}</a>' for subpage in self.subpages)
+        links += ''.join(f'<a href="/docs/brochure{i}.pdf">Brochure {i}</a>' for i in range(self.pdfs))
+        paragraphs = ''.join(f'<p>{sentence}</p>' for sentence in _sentences(rng, self.page_bytes))
+        return (f'<html><head><title>Company {company}</title><script>var tracking = {company};</script></head>'
+                f'<body><nav>{links}</nav><h1>Company {company}{path}</h1>{paragraphs}'
+                f'<footer>{FOOTER}</footer></body></html>').encode('utf-8')
+
+    def _pdf(self, company, path):
+        rng = random.Random(f'{self.seed}-{company}-{path}')
+        return build_pdf([f'Company {company} brochure {path}'] + _sentences(rng, self.pdf_bytes))
+
+    # Bodies are generated off the event loop so large ones do not stall other responses
+    async def _body(self, company, path, build):
+        return await asyncio.get_running_loop().run_in_executor(None, build, company, path)
+
+    async def _handle(self, request):
+        company = self.ports[request.transport.get_extra_info('sockname')[1]]
+        await asyncio.sleep(max(self.latency + random.uniform(-self.jitter, self.jitter), 0))
+        path = request.path
+        if path == '/robots.txt':
+            return web.Response(text='User-agent: *\nAllow: /\n')
+        if path == '/':
+            if company in self.failing:
+                return web.Response(status=503, text='Service Unavailable')
+            return web.Response(body=await self._body(company, path, self._page), content_type='text/html')
+        if path in self.subpages:
+            return web.Response(body=await self._body(company, path, self._page), content_type='text/html')
+        if path.startswith('/docs/brochure') and path.endswith('.pdf'):
+            return web.Response(body=await self._body(company, path, self._pdf), content_type='application/pdf')
+        return web.Response(status=404, text='Not Found')
+
+    async def _start(self, sockets):
+        app = web.Application()
+        app.router.add_route('GET', '/{tail:.*}', self._handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        for sock in sockets:
+            await web.SockSite(self.runner, sock).start()
+
+    def start(self):
+        sockets = []
+        for company in range(self.companies):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.bind(('127.0.0.1', 0))
+            sock.listen(128)
+            self.ports[sock.getsockname()[1]] = company
+            sockets.append(sock)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='synthetic-web', daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(sockets), self.loop).result()
+        return self
+
+    def urls(self):
+        return [f'http://127.0.0.1:{port}/' for port in self.ports]
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+# Function to write the benchmark input CSV in the format process_companies reads
+def write_input_csv(urls, file_path):
+    pd.DataFrame({
+        'Company': [f'Company {i}' for i in range(len(urls))],
+        'Website': urls,
+        'Person LinkedIn Url': [f'https://www.linkedin.com/in/person-{i}' for i in range(len(urls))],
+    }).to_csv(file_path, index=False)
+
+
+def _peak_rss_mb(who):
+    if who == 'self' and os.path.exists('/proc/self/status'):
+        # VmHWM is this process' own peak, ru_maxrss would also count the parent's memory at fork time
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF if who == 'self' else resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)  # bytes on macOS, KB elsewhere
+
+
+# Function to run one scenario in a fresh process (so peak memory is per scenario) against the running server
+def run_scenario(config, input_file, work_dir):
+    os.environ['HTTP_CACHE_PATH'] = os.path.join(work_dir, 'http_cache.sqlite')
+    os.environ['LLM_CACHE_PATH'] = os.path.join(work_dir, 'llm_cache.sqlite')
+    import company_app
+    import pipeline
+    import scrapping
+    import token_budget
+
+    timings = {'fetch': [], 'scrape': [], 'llm': []}
+
+    def fake_llm(text):
+        time.sleep(config['llm_latency'] + token_budget.count_tokens(text) / 1000 * config['llm_seconds_per_1k_tokens'])
+
+    # Fake LLM backend: sleeps like a model call, no network and no keys needed
+    def fake_analyze_scrap(text, *args, **kwargs):
+        fake_llm(text)
+        return f"Analysis of {len(text)} characters"
+
+    def fake_analyze_structured(website_text, pdf_text, *args, **kwargs):
+        if not (website_text or pdf_text):
+            return {section: '' for section in scrapping.SECTIONS}
+        fake_llm(website_text + pdf_text)
+        return {section: f"{section} of {len(website_text) + len(pdf_text)} characters" for section in scrapping.SECTIONS}
+
+    def timed(func, stage):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings[stage].append(time.perf_counter() - start)
+        return wrapper
+
+    def timed_async(func, stage):
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                timings[stage].append(time.perf_counter() - start)
+        return wrapper
+
+    scrapping.Analyze_scrap = fake_analyze_scrap
+    scrapping.Analyze_structured = fake_analyze_structured
+    pipeline.fetch_website = timed_async(pipeline.fetch_website, 'fetch')
+    pipeline.process_company = timed(pipeline.process_company, 'scrape')
+    pipeline.analyze_profile = timed(pipeline.analyze_profile, 'llm')
+
+    start = time.perf_counter()
+    company_app.process_companies(
+        input_file, os.path.join(work_dir, 'profiles.csv'), os.path.join(work_dir, 'logs.csv'),
+        num_threads=config['num_threads'], llm_workers=config['llm_workers'],
+        checkpoint_file=os.path.join(work_dir, 'checkpoint.sqlite'),
+    )
+    elapsed = time.perf_counter() - start
+
+    result = {
+        'Companies': config['companies'],
+        'Threads': config['num_threads'],
+        'Seconds': round(elapsed, 2),
+        'Companies/sec': round(config['companies'] / elapsed, 2),
+    }
+    for stage, values in timings.items():
+        values = sorted(values)
+        result[f'{stage.title()} p50 (s)'] = round(metrics.percentile(values, 50), 3) if values else None
+        result[f'{stage.title()} p99 (s)'] = round(metrics.percentile(values, 99), 3) if values else None
+    result['Peak RSS (MB)'] = _peak_rss_mb('self')
+    result['Peak RSS PDF Workers (MB)'] = _peak_rss_mb('children')
+    return result
+
+
+# Function to serve a scenario's synthetic sites and benchmark process_companies against them
+def benchmark(name, overrides=None):
+    config = {**DEFAULTS, **SCENARIOS.get(name, {}), **(overrides or {})}
+    with tempfile.TemporaryDirectory(prefix='scrape_bench_') as work_dir, SyntheticWeb(**config) as synthetic_web:
+        input_file = os.path.join(work_dir, 'companies.csv')
+        write_input_csv(synthetic_web.urls(), input_file)
+        # Spawned so every scenario starts from a clean interpreter and its own peak memory
+        # (an executor worker, unlike a Pool worker, may start the PDF parser processes)
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            result = executor.submit(run_scenario, config, input_file, work_dir).result()
+    return {'Scenario': name, **result}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline throughput benchmark of the company scraping pipeline")
+    parser.add_argument('--scenario', nargs='+', default=['baseline'], choices=sorted(SCENARIOS), help="Scenarios to run")
+    parser.add_argument('--companies', type=int, default=DEFAULTS['companies'])
+    parser.add_argument('--threads', type=int, nargs='+', default=[DEFAULTS['num_threads']], help="Thread counts to compare")
+    parser.add_argument('--llm-workers', type=int, default=DEFAULTS['llm_workers'])
+    parser.add_argument('--output', help="Also write the results to this CSV file")
+    args = parser.parse_args()
+
+    results = []
+    for name in args.scenario:
+        for num_threads in args.threads:
+            print(f"Running {name} with {args.companies} companies and {num_threads} threads...")
+            results.append(benchmark(name, {'companies': args.companies, 'num_threads': num_threads, 'llm_workers': args.llm_workers}))
+    df = pd.DataFrame(results)
+    print(df.to_string(index=False))
+    if args.output:
+        df.to_csv(args.output, index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+import asyncio
+import heapq
+import threading
+from collections import OrderedDict
+from urllib.parse import urljoin, urlparse, urlunparse, parse_qsl, urlencode
+from urllib.robotparser import RobotFileParser
+import fetch_engine
+import html_extract
+import http_cache
+import retry_policy
+
+# Path keywords that usually lead to pages worth sending to the LLM, with their weight
+RELEVANT_KEYWORDS = {
+    'about': 10, 'leadership': 9, 'team': 8, 'management': 8, 'founder': 7, 'company': 6, 'who-we-are': 9,
+    'product': 9, 'solution': 8, 'service': 8, 'platform': 6, 'industr': 5, 'customer': 5, 'case-stud': 5,
+    'news': 7, 'press': 7, 'media': 4, 'blog': 3, 'investor': 6, 'partner': 4, 'pricing': 4, 'career': 2,
+}
+# Links never worth crawling
+SKIP_KEYWORDS = ('login', 'signin', 'sign-in', 'register', 'cart', 'checkout', 'account', 'privacy', 'terms',
+                 'cookie', 'legal', 'search', 'wp-admin', 'feed')
+SKIP_EXTENSIONS = ('.pdf', '.jpg', '.jpeg', '.png', '.gif', '.svg', '.webp', '.zip', '.mp4', '.mp3', '.css', '.js',
+                   '.xml', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx')
+TRACKING_PARAMS = ('utm_', 'gclid', 'fbclid', 'mc_cid', 'mc_eid')
+
+MAX_PAGES = 5  # Pages fetched per company besides the homepage
+MAX_CRAWL_BYTES = 2 * 1024 * 1024  # Bytes downloaded per company besides the homepage
+MAX_DEPTH = 2
+MAX_ROBOTS = 64  # robots.txt files kept for hosts listed by several companies
+
+
+# Function to canonicalize a URL for deduplication: no fragment, tracking parameters or trailing slash
+def canonicalize_url(url):
+    parts = urlparse(url)
+    query = sorted((key, value) for key, value in parse_qsl(parts.query) if not key.lower().startswith(TRACKING_PARAMS))
+    path = parts.path.rstrip('/') or '/'
+    return urlunparse((parts.scheme.lower(), retry_policy.normalize_domain(url), path, '', urlencode(query), ''))
+
+
+# Function to score how likely a same-domain link leads to useful company information
+def score_link(url):
+    path = urlparse(url).path.lower()
+    if path.endswith(SKIP_EXTENSIONS) or any(keyword in path for keyword in SKIP_KEYWORDS):
+        return None
+    score = sum(weight for keyword, weight in RELEVANT_KEYWORDS.items() if keyword in path)
+    depth = len([segment for segment in path.split('/') if segment])
+    return score - depth  # Prefer shallow pages among equally relevant ones
+
+
+# Result of crawling a company site: the homepage plus the extra pages that were fetched
+class CrawlResult:
+    def __init__(self, pages, crawled_bytes, changed_pages=0):
+        self.pages = pages  # list of (url, ExtractedPage), homepage first
+        self.crawled_bytes = crawled_bytes
+        self.changed_pages = changed_pages  # Crawled pages that are new or changed since the last run
+
+    # Combine all pages into one ExtractedPage (with absolute links) for the profile and the PDF stage
+    def merged_page(self):
+        homepage = self.pages[0][1]
+        text = ' '.join(page.text for _, page in self.pages if page.text)
+        links = list(dict.fromkeys(urljoin(url, link) for url, page in self.pages for link in page.links))
+        return html_extract.ExtractedPage(text, homepage.title, links, homepage.link_count)
+
+
+# Per-run crawler: ranks same-domain links by relevance, honors robots.txt and fetches
+# up to a page and byte budget per company concurrently on the fetch engine; with an HTTP
+# cache the body hash of every crawled page is kept to tell whether the site changed
+class SiteCrawler:
+    def __init__(self, engine=None, max_pages=MAX_PAGES, max_bytes=MAX_CRAWL_BYTES, max_depth=MAX_DEPTH, timeout=15, cache=None,
+                 max_robots=MAX_ROBOTS):
+        self.engine = engine or fetch_engine.get_engine()
+        self.cache = cache
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.max_depth = max_depth
+        self.timeout = timeout
+        self.max_robots = max_robots
+        # host -> RobotFileParser (or None when robots.txt is unavailable), least recently used first
+        self.robots = OrderedDict()
+        self.robots_lock = threading.Lock()
+
+    async def _fetch_robots(self, base_url, headers):
+        parts = urlparse(base_url)
+        robots_url = urlunparse((parts.scheme, parts.netloc, '/robots.txt', '', '', ''))
+        try:
+            response = await self.engine.fetch(robots_url, headers=headers, timeout=self.timeout, max_bytes=512 * 1024)
+        except fetch_engine.FetchError:
+            return None
+        if response.status_code >= 400:
+            return None
+        parser = RobotFileParser()
+        parser.parse(response.text.splitlines())
+        return parser
+
+    def _robots_for(self, base_url, headers):
+        host = retry_policy.normalize_domain(base_url)
+        with self.robots_lock:
+            if host in self.robots:
+                self.robots.move_to_end(host)
+                return self.robots[host]
+        parser = self.engine.run(self._fetch_robots(base_url, headers))
+        with self.robots_lock:
+            self.robots[host] = parser
+            if len(self.robots) > self.max_robots:
+                self.robots.popitem(last=False)
+        return parser
+
+    # Function to compare a crawled page with the last run's version, recording its new hash; subpages
+    # are keyed apart from homepages so they never replace the parsed data cached for a homepage
+    def _changed(self, url, response):
+        key = 'crawl:' + url
+        content_hash = http_cache.body_hash(response.content)
+        cached = self.cache.get(key)
+        if cached is not None and cached['body_hash'] == content_hash:
+            return False
+        self.cache.put(key, response.headers, content_hash, {})
+        return True
+
+    def _allowed(self, robots, url, user_agent):
+        return robots is None or robots.can_fetch(user_agent, url)
+
+    async def _fetch_batch(self, urls, headers, byte_budget):
+        async def fetch_one(url):
+            try:
+                return await self.engine.fetch(url, headers=headers, timeout=self.timeout, max_bytes=byte_budget)
+            except fetch_engine.FetchError:
+                return None
+        return await asyncio.gather(*(fetch_one(url) for url in urls))
+
+    def _add_links(self, frontier, seen, robots, user_agent, page_url, links, depth):
+        home_host = retry_policy.normalize_domain(page_url)
+        for link in links:
+            url = urljoin(page_url, link)
+            if urlparse(url).scheme not in ('http', 'https') or retry_policy.normalize_domain(url) != home_host:
+                continue
+            canonical = canonicalize_url(url)
+            if canonical in seen:
+                continue
+            score = score_link(url)
+            if score is None or not self._allowed(robots, url, user_agent):
+                continue
+            seen.add(canonical)
+            heapq.heappush(frontier, (-score, depth, len(seen), url))
+
+    # Function to crawl the most relevant pages linked from an already fetched homepage (blocking)
+    def crawl(self, homepage_url, homepage, headers=None):
+        headers = headers or {}
+        user_agent = headers.get('User-Agent', '*')
+        pages = [(homepage_url, homepage)]
+        crawled_bytes = 0
+        changed_pages = 0
+        if not self.max_pages:
+            return CrawlResult(pages, crawled_bytes)
+        robots = self._robots_for(homepage_url, headers)
+        home_host = retry_policy.normalize_domain(homepage_url)
+        seen = {canonicalize_url(homepage_url)}
+        frontier = []
+        self._add_links(frontier, seen, robots, user_agent, homepage_url, homepage.links, 1)
+
+        while frontier and len(pages) - 1 < self.max_pages and crawled_bytes < self.max_bytes:
+            batch = []
+            while frontier and len(batch) < self.max_pages - (len(pages) - 1):
+                batch.append(heapq.heappop(frontier))
+            # Each page may use what is left of the byte budget
+            responses = self.engine.run(self._fetch_batch([url for _, _, _, url in batch], headers, self.max_bytes - crawled_bytes))
+            for (_, depth, _, url), response in zip(batch, responses):
+                if response is None or response.status_code != 200 or retry_policy.normalize_domain(response.url) != home_host:
+                    continue
+                if 'html' not in (http_cache.get_header(response.headers, 'Content-Type') or 'text/html'):
+                    continue
+                if crawled_bytes + len(response.content) > self.max_bytes:
+                    continue
+                crawled_bytes += len(response.content)
+                page = html_extract.extract_page(response.text)
+                pages.append((response.url, page))
+                if self.cache is not None and self._changed(url, response):
+                    changed_pages += 1
+                if depth < self.max_depth:
+                    self._add_links(frontier, seen, robots, user_agent, response.url, page.links, depth + 1)
+        return CrawlResult(pages, crawled_bytes, changed_pages)
@@ -0,0 +1,77 @@
+import re
+import zlib
+import token_budget
+
+# Scraped text has no paragraph structure left, so passages are cut at sentence ends
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+_WORD = re.compile(r'\w+')
+
+SHINGLE_SIZE = 3  # Words per shingle
+MIN_SHINGLE_WORDS = 6  # Shorter passages are only dropped when repeated exactly
+SIMILARITY_THRESHOLD = 0.8  # Jaccard similarity of shingle sets above which a passage is a near-duplicate
+MAX_POSTINGS = 50  # Shingles shared by more kept passages than this are too common to find candidates
+
+# Short passages that are boilerplate wherever they appear (cookie banners, legal footers)
+BOILERPLATE = re.compile(
+    r'we use cookies|accept (all )?cookies|cookie (policy|settings|preferences)|all rights reserved'
+    r'|terms (of use|of service|and conditions)|privacy policy|subscribe to our newsletter',
+    re.IGNORECASE,
+)
+MAX_BOILERPLATE_WORDS = 30
+
+
+def _shingles(words):
+    return {zlib.crc32(' '.join(words[i:i + SHINGLE_SIZE]).encode('utf-8'))
+            for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+# Passages kept so far for one company, indexed by shingle to find near-duplicates quickly
+class PassageIndex:
+    def __init__(self, threshold=SIMILARITY_THRESHOLD):
+        self.threshold = threshold
+        self.exact = set()
+        self.postings = {}  # shingle -> ids of kept passages containing it
+        self.sizes = []  # shingle count of each kept passage
+
+    # Check a passage against the kept ones and keep it when it is new
+    def add(self, passage):
+        words = _WORD.findall(passage.lower())
+        if not words:
+            return False
+        key = ' '.join(words)
+        if key in self.exact:
+            return False
+        if len(words) <= MAX_BOILERPLATE_WORDS and BOILERPLATE.search(passage):
+            return False
+        shingles = _shingles(words) if len(words) >= MIN_SHINGLE_WORDS else set()
+        if shingles:
+            overlaps = {}
+            for shingle in shingles:
+                ids = self.postings.get(shingle, ())
+                if len(ids) <= MAX_POSTINGS:
+                    for passage_id in ids:
+                        overlaps[passage_id] = overlaps.get(passage_id, 0) + 1
+            for passage_id, overlap in overlaps.items():
+                if overlap / (len(shingles) + self.sizes[passage_id] - overlap) >= self.threshold:
+                    return False
+            passage_id = len(self.sizes)
+            self.sizes.append(len(shingles))
+            for shingle in shingles:
+                self.postings.setdefault(shingle, []).append(passage_id)
+        self.exact.add(key)
+        return True
+
+
+# Function to drop repeated and near-duplicate passages within and across texts (earlier texts win)
+def dedup_texts(texts, index=None):
+    index = index or PassageIndex()
+    return [' '.join(passage for passage in _SENTENCE_END.split(text) if index.add(passage)) for text in texts]
+
+
+# Function to deduplicate a profile's website and PDF text in place, returning the tokens saved
+def dedup_profile(profile, fields=('Website Text', 'PDF Text')):
+    texts = [profile[field] for field in fields]
+    deduped = dedup_texts(texts)
+    for field, text in zip(fields, deduped):
+        profile[field] = text
+    return sum(token_budget.count_tokens(text) for text in texts) - sum(token_budget.count_tokens(text) for text in deduped)
@@ -0,0 +1,222 @@
+import asyncio
+import atexit
+import socket
+import threading
+import time
+import aiohttp
+import metrics
+import retry_policy
+
+
+# Errors raised by the fetch engine (mirrors requests.RequestException / Timeout)
+class FetchError(Exception):
+    pass
+
+
+class FetchTimeout(FetchError):
+    pass
+
+
+# Failures another attempt will not fix (DNS, TLS, invalid URL, redirect loops): callers fail fast
+class PermanentFetchError(FetchError):
+    pass
+
+
+# Raised without sending anything while the domain's circuit breaker is open
+class CircuitOpenError(PermanentFetchError):
+    pass
+
+
+# Response object exposing the same fields scrape_website reads from requests.Response
+class FetchResponse:
+    def __init__(self, url, status_code, headers, cookies, history, content, encoding=None, timings=None):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.cookies = cookies
+        self.history = history
+        self.content = content
+        self.encoding = encoding or 'utf-8'
+        self.timings = timings or {}  # seconds spent in 'queue', 'dns', 'connect', 'wait' (until headers) and 'download'
+
+    @property
+    def text(self):
+        try:
+            return self.content.decode(self.encoding, errors='replace')
+        except LookupError:  # Charset Python does not know (e.g. utf8mb4)
+            return self.content.decode('utf-8', errors='replace')
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise FetchError(f"{self.status_code} error for url: {self.url}")
+
+
+# aiohttp trace hooks adding up the queue (waiting for a free per-host slot), DNS, connect and wait
+# (headers sent until response headers) time of a request in the timings dict passed as
+# trace_request_ctx; redirects add to the same totals
+def _trace_phase(phase):
+    async def on_start(session, context, params):
+        context.trace_request_ctx[f'_{phase}_start'] = time.perf_counter()
+
+    async def on_end(session, context, params):
+        timings = context.trace_request_ctx
+        started = timings.pop(f'_{phase}_start', None)
+        if started is not None:
+            timings[phase] = timings.get(phase, 0) + time.perf_counter() - started
+    return on_start, on_end
+
+
+def _make_trace_config():
+    trace_config = aiohttp.TraceConfig()
+    for phase, start_signal, end_signals in (
+        ('queue', trace_config.on_connection_queued_start, (trace_config.on_connection_queued_end,)),
+        ('dns', trace_config.on_dns_resolvehost_start, (trace_config.on_dns_resolvehost_end,)),
+        ('connect', trace_config.on_connection_create_start, (trace_config.on_connection_create_end,)),
+        # A redirect hop ends with on_request_redirect instead of on_request_end
+        ('wait', trace_config.on_request_headers_sent, (trace_config.on_request_redirect, trace_config.on_request_end)),
+    ):
+        on_start, on_end = _trace_phase(phase)
+        start_signal.append(on_start)
+        for end_signal in end_signals:
+            end_signal.append(on_end)
+    return trace_config
+
+
+# Function to classify a client error: DNS, TLS, invalid URL and redirect loop errors are permanent
+def is_permanent_error(error):
+    if isinstance(error, (aiohttp.ClientSSLError, aiohttp.InvalidURL, aiohttp.TooManyRedirects)):
+        return True
+    return isinstance(error, aiohttp.ClientConnectorError) and isinstance(error.os_error, socket.gaierror)
+
+
+# Asyncio fetch engine with a pooled connector, running on its own event loop thread
+# so that both coroutines and plain worker threads can share the same connections.
+class FetchEngine:
+    def __init__(self, max_connections=200, max_per_host=4, timeout=20, breaker=None):
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.breaker = breaker or retry_policy.CircuitBreaker()  # Shared by page, crawl and PDF requests
+        self._session = None
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+
+    async def _get_session(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_per_host,  # Per-host concurrency limit
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(connector=connector, trace_configs=[_make_trace_config()])
+        return self._session
+
+    # Coroutine to fetch a single URL; must run on the engine loop
+    async def fetch(self, url, headers=None, cookies=None, timeout=None, max_bytes=None):
+        domain = retry_policy.normalize_domain(url)
+        if not self.breaker.allow(domain):
+            metrics.increment('fetch_circuit_rejections')
+            raise CircuitOpenError(f"Circuit open for {domain} after repeated failures")
+        session = await self._get_session()
+        client_timeout = aiohttp.ClientTimeout(total=timeout or self.timeout)
+        timings = {}
+        metrics.increment('fetch_requests')
+        recorded = False
+        try:
+            async with session.get(url, headers=headers, cookies=cookies, timeout=client_timeout, trace_request_ctx=timings) as response:
+                # The host answered: only server errors and rate limits count against its circuit
+                if response.status == 429 or response.status >= 500:
+                    self.breaker.record_failure(domain)
+                else:
+                    self.breaker.record_success(domain)
+                recorded = True
+                download_start = time.perf_counter()
+                if max_bytes is None:
+                    content = await response.read()
+                else:
+                    content = await self._read_capped(response, max_bytes)
+                timings['download'] = time.perf_counter() - download_start
+                # Connecting includes resolving the host, count each phase once
+                timings['connect'] = max(timings.get('connect', 0) - timings.get('dns', 0), 0)
+                for phase in ('queue', 'dns', 'connect', 'wait', 'download'):
+                    metrics.observe(f'fetch_{phase}', timings.get(phase, 0))
+                metrics.increment('fetch_bytes', len(content))
+                return FetchResponse(
+                    url=str(response.url),
+                    status_code=response.status,
+                    headers=dict(response.headers),
+                    cookies={key: morsel.value for key, morsel in response.cookies.items()},
+                    history=response.history,
+                    content=content,
+                    encoding=response.charset,
+                    timings={phase: round(seconds, 3) for phase, seconds in timings.items() if not phase.startswith('_')},
+                )
+        except asyncio.TimeoutError as e:
+            metrics.increment('fetch_timeouts')
+            raise FetchTimeout('Request timed out') from e
+        except (aiohttp.ClientError, ValueError) as e:
+            metrics.increment('fetch_errors')
+            if is_permanent_error(e):
+                raise PermanentFetchError(str(e) or type(e).__name__) from e
+            raise FetchError(str(e) or type(e).__name__) from e
+        finally:
+            if not recorded:
+                self.breaker.record_failure(domain)
+
+    # Read a body in chunks, giving up as soon as it grows past max_bytes
+    async def _read_capped(self, response, max_bytes):
+        if response.content_length is not None and response.content_length > max_bytes:
+            raise FetchError(f"Response of {response.content_length} bytes exceeds the {max_bytes} byte limit")
+        chunks = []
+        size = 0
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            size += len(chunk)
+            if size > max_bytes:
+                raise FetchError(f"Response exceeds the {max_bytes} byte limit")
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+    # Schedule a coroutine on the engine loop, returns a concurrent.futures.Future
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    # Run a coroutine on the engine loop and block until it finishes
+    def run(self, coro):
+        return self.submit(coro).result()
+
+    # Blocking fetch for callers running in worker threads
+    def get(self, url, **kwargs):
+        return self.run(self.fetch(url, **kwargs))
+
+    async def _close_session(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def close(self):
+        if self.loop.is_running():
+            self.run(self._close_session())
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+        self.loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+_default_engine = None
+_default_engine_lock = threading.Lock()
+
+
+# Function to get the shared engine used when no engine is passed explicitly
+def get_engine():
+    global _default_engine
+    with _default_engine_lock:
+        if _default_engine is None:
+            _default_engine = FetchEngine()
+            atexit.register(_default_engine.close)
+        return _default_engine
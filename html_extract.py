@@ -0,0 +1,164 @@
+import os
+from html.parser import HTMLParser
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as SelectolaxParser
+except ImportError:
+    SelectolaxParser = None
+
+try:
+    from lxml import etree
+    import lxml.html
+except ImportError:
+    lxml = None
+
+# Elements whose text is never worth sending to the LLM
+SKIP_TAGS = {'script', 'style', 'noscript', 'template', 'svg', 'canvas', 'iframe', 'head'}
+# Repeated navigation blocks: their links are still collected, their text is dropped
+MENU_TAGS = {'nav'}
+MENU_ROLES = {'navigation', 'menu', 'menubar'}
+
+
+# Result of a single extraction pass over a page
+class ExtractedPage:
+    def __init__(self, text, title, links, link_count=None):
+        self.text = text
+        self.title = title
+        self.links = links
+        self.link_count = len(links) if link_count is None else link_count
+        self.pdf_links = [link for link in links if link.lower().endswith('.pdf')]
+
+
+def _clean(parts):
+    return ' '.join(' '.join(parts).split())
+
+
+def _is_boilerplate(tag, role):
+    return tag in SKIP_TAGS or tag in MENU_TAGS or (role or '').lower() in MENU_ROLES
+
+
+# Streaming extractor on the standard library parser (always available)
+class _StdlibExtractor(HTMLParser):
+    VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+    # Elements allowed in <head>: any other element or visible text ends it (</head> is optional in HTML)
+    HEAD_TAGS = {'base', 'link', 'meta', 'noscript', 'script', 'style', 'template', 'title'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.title_parts = []
+        self.links = []
+        self.link_count = 0
+        self.skip_stack = []  # open boilerplate tags
+        self.in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'a':
+            self.link_count += 1
+            if attrs.get('href'):
+                self.links.append(attrs['href'])
+        elif tag == 'title':
+            self.in_title = True
+        if tag not in self.HEAD_TAGS and 'head' in self.skip_stack:
+            self._close_head()
+        if tag not in self.VOID_TAGS and _is_boilerplate(tag, attrs.get('role')):
+            self.skip_stack.append(tag)
+
+    def _close_head(self):
+        del self.skip_stack[self.skip_stack.index('head'):]
+
+    def handle_endtag(self, tag):
+        if tag == 'title':
+            self.in_title = False
+        if tag in self.skip_stack:
+            while self.skip_stack and self.skip_stack.pop() != tag:
+                pass
+
+    def handle_data(self, data):
+        if self.in_title:
+            self.title_parts.append(data)
+            return
+        if self.skip_stack and self.skip_stack[-1] == 'head' and data.strip():
+            self._close_head()  # Text directly in <head> starts the body
+        if not self.skip_stack:
+            self.parts.append(data)
+
+
+def _extract_stdlib(html):
+    extractor = _StdlibExtractor()
+    extractor.feed(html)
+    extractor.close()
+    return ExtractedPage(_clean(extractor.parts), _clean(extractor.title_parts) or 'N/A', extractor.links, extractor.link_count)
+
+
+def _extract_lxml(html):
+    parser = lxml.html.HTMLParser(encoding='utf-8')
+    try:
+        root = lxml.html.fromstring(html.encode('utf-8'), parser=parser)
+    except (etree.ParserError, ValueError):
+        return ExtractedPage('', 'N/A', [])
+    parts, links = [], []
+    link_count = 0
+    title = None
+    skip_depth = 0
+    for event, element in etree.iterwalk(root, events=('start', 'end', 'comment', 'pi')):
+        if event in ('comment', 'pi'):
+            if not skip_depth and element.tail:
+                parts.append(element.tail)
+            continue
+        tag = element.tag
+        boilerplate = _is_boilerplate(tag, element.get('role'))
+        if event == 'start':
+            if tag == 'a':
+                link_count += 1
+                if element.get('href'):
+                    links.append(element.get('href'))
+            elif tag == 'title' and title is None:
+                title = element.text_content()
+            if boilerplate:
+                skip_depth += 1
+            elif not skip_depth and element.text:
+                parts.append(element.text)
+        else:
+            if boilerplate:
+                skip_depth -= 1
+            if not skip_depth and element.tail:
+                parts.append(element.tail)
+    return ExtractedPage(_clean(parts), _clean([title or '']) or 'N/A', links, link_count)
+
+
+def _extract_selectolax(html):
+    tree = SelectolaxParser(html)
+    title_node = tree.css_first('title')
+    anchors = tree.css('a')
+    links = [node.attributes.get('href') for node in anchors if node.attributes.get('href')]
+    tree.strip_tags(list(SKIP_TAGS - {'head'}))
+    for selector in list(MENU_TAGS) + [f'[role="{role}"]' for role in MENU_ROLES]:
+        for node in tree.css(selector):
+            node.decompose()
+    body = tree.body
+    text = body.text(separator=' ') if body is not None else ''
+    title = title_node.text() if title_node is not None else ''
+    return ExtractedPage(_clean([text]), _clean([title]) or 'N/A', links, len(anchors))
+
+
+BACKENDS = {
+    'lxml': _extract_lxml if lxml is not None else None,
+    'selectolax': _extract_selectolax if SelectolaxParser is not None else None,
+    'stdlib': _extract_stdlib,
+}
+
+
+# Function to list the extractor backends installed here, fastest first
+def available_backends():
+    return [name for name, extract in BACKENDS.items() if extract is not None]
+
+
+# Function to extract visible text, title, links and PDF links from a page in one pass
+def extract_page(html, backend=None):
+    backend = backend or os.getenv('HTML_EXTRACTOR') or available_backends()[0]
+    extract = BACKENDS.get(backend)
+    if extract is None:
+        raise ValueError(f"HTML extractor backend '{backend}' is not available (installed: {available_backends()})")
+    return extract(html)
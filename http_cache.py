@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+# Function to hash a downloaded body for change detection
+def body_hash(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+# Function to read a response header regardless of its case
+def get_header(headers, name):
+    for key, value in headers.items():
+        if key.lower() == name.lower():
+            return value
+    return None
+
+
+# Function to build If-None-Match / If-Modified-Since headers from a cached entry
+def conditional_headers(entry):
+    headers = {}
+    if entry:
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+
+LOCK_TIMEOUT = 60  # seconds to wait for another process' write to the cache
+
+
+# Function to open a cache database shared by the worker processes of a batch run: they wait
+# for each other's writes instead of failing after 5s, and readers never block the writer
+def connect(path):
+    connection = sqlite3.connect(path, timeout=LOCK_TIMEOUT, check_same_thread=False)
+    connection.execute('PRAGMA journal_mode=WAL')
+    return connection
+
+
+# Local HTTP cache storing validators, body hashes and the text/fields derived from each URL,
+# with size-based (least recently used) eviction
+class HTTPCache:
+    def __init__(self, path='http_cache.sqlite', max_bytes=500 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.connection = connect(path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            'url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, body_hash TEXT, data TEXT, fetched REAL, '
+            'size INTEGER, last_access REAL)'
+        )
+        self.connection.commit()
+        self._migrate()
+        self.connection.execute('CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)')
+        self.connection.commit()
+
+    # Add the eviction columns to a cache written before they existed (once, even with several workers)
+    def _migrate(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        columns = {row[1] for row in self.connection.execute('PRAGMA table_info(entries)')}
+        if 'size' not in columns:
+            self.connection.execute('ALTER TABLE entries ADD COLUMN size INTEGER')
+            self.connection.execute('ALTER TABLE entries ADD COLUMN last_access REAL')
+            self.connection.execute('UPDATE entries SET size = LENGTH(CAST(data AS BLOB)), last_access = fetched')
+        self.connection.commit()
+
+    def get(self, url):
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT etag, last_modified, body_hash, data FROM entries WHERE url = ?', (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.connection.execute('UPDATE entries SET last_access = ? WHERE url = ?', (time.time(), url))
+            self.connection.commit()
+        return {'etag': row[0], 'last_modified': row[1], 'body_hash': row[2], 'data': json.loads(row[3])}
+
+    def put(self, url, headers, content_hash, data):
+        now = time.time()
+        data = json.dumps(data)
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO entries (url, etag, last_modified, body_hash, data, fetched, size, last_access) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (url, get_header(headers, 'ETag'), get_header(headers, 'Last-Modified'), content_hash, data, now,
+                 len(data.encode('utf-8')), now),
+            )
+            self._evict()
+            self.connection.commit()
+
+    # Drop least recently used entries until the cache fits in max_bytes
+    def _evict(self):
+        total = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.connection.execute('SELECT url, size FROM entries ORDER BY last_access').fetchall()
+        for url, size in rows:
+            if total <= self.max_bytes:
+                break
+            self.connection.execute('DELETE FROM entries WHERE url = ?', (url,))
+            total -= size
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+HTTP_CACHE_PATH = os.getenv('HTTP_CACHE_PATH', 'http_cache.sqlite')
+HTTP_CACHE_MAX_MB = int(os.getenv('HTTP_CACHE_MAX_MB', '500'))
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+# Function to get the shared HTTP cache, opened on first use
+def get_http_cache():
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = HTTPCache(HTTP_CACHE_PATH, HTTP_CACHE_MAX_MB * 1024 * 1024)
+        return _default_cache
@@ -0,0 +1,107 @@
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+
+MAX_MESSAGES = 200  # Latest messages kept per job for the GUI
+
+
+# A background run: its own output directory, progress counters, stage metrics, LLM key pool
+# and a bounded message log, updated by the worker threads and polled by the GUI
+class Job:
+    def __init__(self, job_id, output_dir, key=None):
+        self.id = job_id
+        self.output_dir = output_dir
+        self.key = key
+        self.lock = threading.Lock()
+        self.status = 'queued'
+        self.total = 0
+        self.completed = 0
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.error = None
+        self.messages = deque(maxlen=MAX_MESSAGES)
+        self.metrics = metrics.Metrics()  # Recorded by the threads of this job only
+        self.key_pool = None  # API keys and quotas of this job, set before it is queued
+
+    def log(self, message):
+        with self.lock:
+            self.messages.append(f"{time.strftime('%H:%M:%S')} {message}")
+
+    def set_progress(self, completed, total=None):
+        with self.lock:
+            self.completed = completed
+            if total is not None:
+                self.total = total
+
+    # Function to get a consistent view of the job for display
+    def snapshot(self):
+        with self.lock:
+            elapsed = ((self.finished or time.time()) - self.started) if self.started else 0
+            return {
+                'id': self.id,
+                'status': self.status,
+                'completed': self.completed,
+                'total': self.total,
+                'progress': min(self.completed / self.total, 1.0) if self.total else 0.0,
+                'elapsed': round(elapsed, 1),
+                'rows_per_min': round(self.completed / elapsed * 60, 1) if elapsed else 0.0,
+                'error': self.error,
+                'messages': list(self.messages),
+            }
+
+    def is_active(self):
+        with self.lock:
+            return self.status in ('queued', 'running')
+
+
+# Runs jobs on a small thread pool shared by all GUI sessions, so a widget interaction or a
+# second user never restarts or overwrites a running job
+class JobManager:
+    def __init__(self, root_dir='jobs', max_jobs=2):
+        self.root_dir = root_dir
+        self.executor = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix='gui-job')
+        self.lock = threading.Lock()
+        self.jobs = {}
+
+    # Submit func(job, *args); a job with the same key that is still queued or running is returned instead
+    def submit(self, func, *args, key=None, prepare=None):
+        with self.lock:
+            for job in self.jobs.values():
+                if key is not None and job.key == key and job.is_active():
+                    return job
+            job_id = uuid.uuid4().hex[:12]
+            job = Job(job_id, os.path.join(self.root_dir, job_id), key)
+            os.makedirs(job.output_dir, exist_ok=True)
+            if prepare is not None:
+                prepare(job)  # e.g. copy the upload into the job directory before the session moves on
+            self.jobs[job_id] = job
+        self.executor.submit(self._run, job, func, args)
+        return job
+
+    def _run(self, job, func, args):
+        with job.lock:
+            job.status = 'running'
+            job.started = time.time()
+        try:
+            func(job, *args)
+        except Exception as e:
+            traceback.print_exc()
+            with job.lock:
+                job.status = 'failed'
+                job.error = str(e)
+        else:
+            with job.lock:
+                job.status = 'done'
+        finally:
+            with job.lock:
+                job.finished = time.time()
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
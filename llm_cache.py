@@ -0,0 +1,72 @@
+import hashlib
+import json
+import threading
+import time
+import http_cache
+
+
+# Function to build the content-addressed cache key for an LLM call
+def make_cache_key(text, prompt_template, model_config):
+    normalized_text = ' '.join(text.split())  # Whitespace-only changes hit the same entry
+    payload = json.dumps([normalized_text, prompt_template, model_config], sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+# Persistent SQLite cache of LLM responses with size-based (least recently used) eviction
+class LLMCache:
+    def __init__(self, path='llm_cache.sqlite', max_bytes=500 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = http_cache.connect(path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, response TEXT, size INTEGER, created REAL, last_access REAL)'
+        )
+        self.connection.execute('CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)')
+        self.connection.commit()
+
+    def get(self, key):
+        with self.lock:
+            row = self.connection.execute('SELECT response FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.connection.execute('UPDATE responses SET last_access = ? WHERE key = ?', (time.time(), key))
+            self.connection.commit()
+            return row[0]
+
+    def put(self, key, response):
+        now = time.time()
+        size = len(response.encode('utf-8'))
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO responses (key, response, size, created, last_access) VALUES (?, ?, ?, ?, ?)',
+                (key, response, size, now, now),
+            )
+            self._evict()
+            self.connection.commit()
+
+    # Drop least recently used entries until the cache fits in max_bytes
+    def _evict(self):
+        total = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.connection.execute('SELECT key, size FROM responses ORDER BY last_access').fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self.connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+            total -= size
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.connection.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+        return {'LLM Cache Hits': self.hits, 'LLM Cache Misses': self.misses, 'LLM Cache Entries': entries, 'LLM Cache Bytes': size}
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,265 @@
+import cProfile
+import contextlib
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Durations kept per stage for the percentiles (count, total and max cover every span)
+MAX_SAMPLES = 10000
+
+
+# Stage timings and counters: every stage of the pipeline records spans (fetch, parse, crawl,
+# PDF download and parse, truncation, LLM calls) and counters (retries, bytes, tokens) here,
+# exported as a file, an HTTP endpoint and log columns; one process-wide registry, and one
+# per GUI job bound to the threads of its run
+class Metrics:
+    def __init__(self, max_samples=MAX_SAMPLES):
+        self.max_samples = max_samples
+        self.lock = threading.Lock()
+        self.stages = {}  # stage -> {'count', 'total', 'max', 'samples'}
+        self.counters = Counter()
+
+    # Record one duration of a stage (in seconds)
+    def observe(self, stage, seconds):
+        with self.lock:
+            timing = self.stages.get(stage)
+            if timing is None:
+                timing = self.stages[stage] = {'count': 0, 'total': 0.0, 'max': 0.0, 'samples': deque(maxlen=self.max_samples)}
+            timing['count'] += 1
+            timing['total'] += seconds
+            timing['max'] = max(timing['max'], seconds)
+            timing['samples'].append(seconds)
+
+    def increment(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    # Time a block as one span of a stage, optionally adding it to a log entry column as well
+    @contextlib.contextmanager
+    def span(self, stage, log_entry=None, column=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.observe(stage, seconds)
+            if log_entry is not None and column:
+                log_entry[column] = round((log_entry.get(column) or 0) + seconds, 3)
+
+    # Summary per stage (count, total, mean, p50, p99, max in seconds) and all counters
+    def snapshot(self):
+        with self.lock:
+            stages = {}
+            for stage, timing in sorted(self.stages.items()):
+                samples = sorted(timing['samples'])
+                stages[stage] = {
+                    'count': timing['count'],
+                    'total': round(timing['total'], 3),
+                    'mean': round(timing['total'] / timing['count'], 4),
+                    'p50': round(percentile(samples, 50), 4),
+                    'p99': round(percentile(samples, 99), 4),
+                    'max': round(timing['max'], 4),
+                }
+            return {'stages': stages, 'counters': dict(sorted(self.counters.items()))}
+
+    # Snapshot in the Prometheus text format
+    def to_prometheus(self):
+        snapshot = self.snapshot()
+        lines = ['# TYPE scrape_stage_seconds summary']
+        for stage, summary in snapshot['stages'].items():
+            lines.append(f'scrape_stage_seconds{{stage="{stage}",quantile="0.5"}} {summary["p50"]}')
+            lines.append(f'scrape_stage_seconds{{stage="{stage}",quantile="0.99"}} {summary["p99"]}')
+            lines.append(f'scrape_stage_seconds_sum{{stage="{stage}"}} {summary["total"]}')
+            lines.append(f'scrape_stage_seconds_count{{stage="{stage}"}} {summary["count"]}')
+        lines.append('# TYPE scrape_events_total counter')
+        for name, value in snapshot['counters'].items():
+            lines.append(f'scrape_events_total{{event="{name}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    # Write the snapshot as JSON, or in the Prometheus format for a .prom file
+    def write(self, path):
+        content = self.to_prometheus() if path.endswith('.prom') else json.dumps(self.snapshot(), indent=2)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def reset(self):
+        with self.lock:
+            self.stages.clear()
+            self.counters.clear()
+
+
+# Function to get the q-th percentile (nearest rank) of already sorted values
+def percentile(values, q):
+    if not values:
+        return 0.0
+    return values[min(int(round(q / 100 * (len(values) - 1))), len(values) - 1)]
+
+
+registry = Metrics()
+_local = threading.local()
+
+
+# Registry the calling thread records into: the one bound to the thread (e.g. a GUI job's own
+# registry), otherwise the process-wide one
+def current():
+    return getattr(_local, 'registry', None) or registry
+
+
+# Bind the calling thread to a registry, e.g. as the initializer of a run's thread pools
+def bind(target):
+    _local.registry = target
+
+
+# Record into target in the calling thread for the duration of the block
+@contextlib.contextmanager
+def use(target):
+    previous = getattr(_local, 'registry', None)
+    _local.registry = target
+    try:
+        yield target
+    finally:
+        _local.registry = previous
+
+
+# Wrap func so that it records into the caller's registry in whichever thread it runs (for shared pools)
+def bound(func):
+    target = current()
+
+    def wrapper(*args, **kwargs):
+        with use(target):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def observe(stage, seconds):
+    current().observe(stage, seconds)
+
+
+def increment(name, amount=1):
+    current().increment(name, amount)
+
+
+def span(stage, log_entry=None, column=None):
+    return current().span(stage, log_entry, column)
+
+
+def snapshot():
+    return current().snapshot()
+
+
+def write(path):
+    return current().write(path)
+
+
+# Function to serve the metrics on http://host:port/metrics (Prometheus format, JSON with ?format=json)
+def serve(port, host='127.0.0.1'):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            if 'format=json' in self.path:
+                body, content_type = json.dumps(registry.snapshot()).encode('utf-8'), 'application/json'
+            else:
+                body, content_type = registry.to_prometheus().encode('utf-8'), 'text/plain; version=0.0.4'
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
+
+
+# Sampling profiler: records the stacks of all threads every interval and writes them in the
+# collapsed format of flame graph tools ("frame;frame;frame count" per line)
+class SamplingProfiler:
+    def __init__(self, path, interval=0.01):
+        self.path = path
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = traceback.extract_stack(frame)
+                self.stacks[';'.join(f'{os.path.basename(entry.filename)}:{entry.name}' for entry in stack)] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        with open(self.path, 'w', encoding='utf-8') as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f'{stack} {count}\n')
+
+
+# cProfile for the calling thread and every thread started while it runs (pool workers,
+# the fetch engine loop), merged into one pstats file; from Python 3.12 a single profiler
+# already sees every thread
+class ThreadedProfiler:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.profiles = []
+
+    # Installed with threading.setprofile: enables a profiler in each new thread on its first event
+    def _start_thread(self, frame, event, arg):
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        with self.lock:
+            self.profiles.append(profile)
+        profile.enable()
+
+    def start(self):
+        if sys.version_info < (3, 12):
+            threading.setprofile(self._start_thread)
+        self.main_profile = cProfile.Profile()
+        self.main_profile.enable()
+        return self
+
+    def stop(self):
+        self.main_profile.disable()
+        if sys.version_info < (3, 12):
+            threading.setprofile(None)
+        stats = pstats.Stats(self.main_profile)
+        with self.lock:
+            for profile in self.profiles:
+                stats.add(profile)
+        stats.dump_stats(self.path)
+
+
+# Function to profile a single run: a .prof path uses cProfile (view with pstats or snakeviz),
+# any other path the sampling profiler; does nothing without a path
+@contextlib.contextmanager
+def profile_run(path=None):
+    if not path:
+        yield None
+        return
+    profiler = ThreadedProfiler(path) if path.endswith('.prof') else SamplingProfiler(path)
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        print(f"Profile written to {path}")
@@ -0,0 +1,171 @@
+import io
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+import PyPDF2
+import fetch_engine
+import http_cache
+import metrics
+
+# Limits for a single PDF
+MAX_PDF_BYTES = 20 * 1024 * 1024
+PDF_TIMEOUT = 30  # seconds for the whole download
+MAX_PDF_PAGES = 50
+MAX_PARSED_PDFS = 256  # Parsed texts kept by content hash for PDFs shared between companies
+
+
+# Function to extract text from an in-memory PDF (runs in the process pool)
+def extract_text_from_pdf_bytes(content, max_pages=MAX_PDF_PAGES):
+    pdf_text = ""
+    try:
+        reader = PyPDF2.PdfReader(io.BytesIO(content))
+        for page in reader.pages[:max_pages]:
+            pdf_text += page.extract_text() or ''  # Ensure text is added even if None
+    except Exception as e:
+        print(f"Error extracting text from PDF: {e}")
+    # Clean the PDF text: remove new lines and extra spaces
+    return ' '.join(pdf_text.split())
+
+
+# PDF stage: concurrent capped downloads on the fetch engine, CPU-heavy extraction in a
+# process pool, and dedupe by URL (while a download is in flight) and content hash (for the
+# most recent max_parsed PDFs) so shared brochures are parsed once without keeping every text
+class PDFStage:
+    def __init__(self, engine=None, cache=None, max_workers=None, max_bytes=MAX_PDF_BYTES,
+                 timeout=PDF_TIMEOUT, max_pages=MAX_PDF_PAGES, max_parsed=MAX_PARSED_PDFS):
+        self.engine = engine or fetch_engine.get_engine()
+        self.cache = cache
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.max_pages = max_pages
+        self.max_parsed = max_parsed
+        # Spawned parsers: forking a process that already runs the engine loop and worker threads can
+        # copy locks held by those threads into the child
+        self.process_pool = ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(),
+                                                mp_context=multiprocessing.get_context('spawn'))
+        self.lock = threading.Lock()
+        self.url_results = {}  # url -> [Future of the extracted text (None on failure), number of callers waiting on it]
+        self.hash_results = OrderedDict()  # content hash -> Future of the extracted text, least recently used first
+
+    # Coroutine to download one PDF with a conditional request (runs on the engine loop)
+    async def _download(self, url, cached):
+        with metrics.span('pdf_download'):
+            return await self.engine.fetch(
+                url, headers=http_cache.conditional_headers(cached), timeout=self.timeout, max_bytes=self.max_bytes
+            )
+
+    # Function to turn a finished download into text, reusing cached or already parsed content; returns the
+    # parse still running in the process pool as (parse future, response, content hash), or None when done
+    def _start_parse(self, url, cached, download_future, log_entry):
+        text_future = self.url_results[url][0]
+        try:
+            pdf_response = download_future.result()
+            if pdf_response.status_code == 304 and cached:
+                text_future.set_result(cached['data']['Text'])
+                return None
+            pdf_response.raise_for_status()
+            metrics.increment('pdf_bytes', len(pdf_response.content))
+            if log_entry is not None:
+                log_entry['PDF Bytes'] = log_entry.get('PDF Bytes', 0) + len(pdf_response.content)
+            content_hash = http_cache.body_hash(pdf_response.content)
+            if cached and content_hash == cached['body_hash']:
+                self.cache.put(url, pdf_response.headers, content_hash, cached['data'])
+                text_future.set_result(cached['data']['Text'])
+                return None
+            with self.lock:
+                parse_future = self.hash_results.get(content_hash)
+                if parse_future is None:
+                    parse_future = self.process_pool.submit(extract_text_from_pdf_bytes, pdf_response.content, self.max_pages)
+                    self.hash_results[content_hash] = parse_future
+                    if len(self.hash_results) > self.max_parsed:
+                        self.hash_results.popitem(last=False)
+                    metrics.increment('pdfs_parsed')
+                else:
+                    self.hash_results.move_to_end(content_hash)
+            return parse_future, pdf_response, content_hash
+        except Exception as e:
+            print(f"Error downloading PDF {url}: {e}")
+            text_future.set_result(None)
+            return None
+
+    # Function to wait for a parse started by _start_parse and store its text
+    def _finish_parse(self, url, parse, log_entry):
+        parse_future, pdf_response, content_hash = parse
+        text_future = self.url_results[url][0]
+        try:
+            # Time until the parser process answers, including the wait for a free process
+            with metrics.span('pdf_parse'):
+                pdf_text = parse_future.result()
+            if self.cache:
+                self.cache.put(url, pdf_response.headers, content_hash, {'Text': pdf_text})
+            if log_entry is not None and log_entry['Changed since last run'] == 'No':
+                log_entry['Changed since last run'] = 'Yes'  # A linked PDF changed
+            text_future.set_result(pdf_text)
+        except Exception as e:
+            print(f"Error parsing PDF {url}: {e}")
+            text_future.set_result(None)
+
+    # Function to get the text of every PDF linked from a page, blocking until all are done
+    def scrape(self, pdf_links, base_url, log_entry=None):
+        urls = []
+        for pdf_link in pdf_links:
+            if not pdf_link.startswith('http'):
+                pdf_link = base_url + pdf_link
+            urls.append(pdf_link)
+        urls = list(dict.fromkeys(urls))
+
+        downloads = {}
+        text_futures = {}
+        with self.lock:
+            for url in urls:
+                if url in self.url_results:
+                    self.url_results[url][1] += 1  # Another company is already downloading it, wait for that one
+                else:
+                    self.url_results[url] = [Future(), 1]
+                    cached = self.cache.get(url) if self.cache else None
+                    downloads[url] = (cached, self.engine.submit(self._download(url, cached)))
+                text_futures[url] = self.url_results[url][0]
+        # Every parse is submitted as soon as its download is done, then all of them are collected
+        parses = {}
+        for url, (cached, download_future) in downloads.items():
+            parse = self._start_parse(url, cached, download_future, log_entry)
+            if parse is not None:
+                parses[url] = parse
+        for url, parse in parses.items():
+            self._finish_parse(url, parse, log_entry)
+
+        pdf_texts = []
+        for url in urls:
+            pdf_text = text_futures[url].result()
+            with self.lock:
+                # The last reader drops the entry, a later company linking the PDF goes through the HTTP cache
+                self.url_results[url][1] -= 1
+                if self.url_results[url][1] == 0:
+                    del self.url_results[url]
+            if pdf_text is not None:
+                pdf_texts.append(pdf_text)
+        return pdf_texts
+
+    def close(self):
+        self.process_pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+_default_stage = None
+_default_stage_lock = threading.Lock()
+
+
+# Function to get the shared PDF stage used when no stage is passed explicitly
+def get_pdf_stage():
+    global _default_stage
+    with _default_stage_lock:
+        if _default_stage is None:
+            _default_stage = PDFStage(cache=http_cache.get_http_cache())
+        return _default_stage
@@ -0,0 +1,431 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+from urllib.parse import urlparse
+import pandas as pd
+import crawler
+import dedup
+import fetch_engine
+import html_extract
+import http_cache
+import metrics
+import pdf_pipeline
+import render_pool
+import retry_policy
+import scrapping
+import spill
+
+# Scraping pipeline shared by the command line (company_app.py) and the GUI (app_gui.py):
+# fetch on the async engine, parse, render, crawl and PDFs in a thread pool, then the LLM stage
+
+INPUT_COLUMNS = ['Company', 'Website', 'Person LinkedIn Url']
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
+FETCH_TIMEOUT = 10  # seconds per homepage request
+
+
+# Function to stream company data in chunks as (row number, row) pairs
+def iter_company_data(file_path, chunksize=1000):
+    for chunk in pd.read_csv(file_path, chunksize=chunksize):
+        for row_id, row in chunk[INPUT_COLUMNS].dropna().iterrows():
+            yield row_id, row
+
+
+# Function to fetch the website content with logging and retry mechanism (runs on the fetch engine loop)
+async def fetch_website(url, engine, company_name='', max_retries=3, timeout=FETCH_TIMEOUT, cache=None):
+    headers = {'User-Agent': USER_AGENT}
+    retries = 0
+    start_time = time.time()
+    log_entry = {
+        'Website': url,
+        'Company Name': company_name,
+        'Domain': urlparse(url).netloc,
+        'Status': None,
+        'Description': '',
+        'Retries': 0,
+        'Error Class': '',  # Transient, Permanent or Circuit Open for failed fetches
+        'Time of Attempt': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'Response Code': None,
+        'Response Time': None,
+        'Headers Sent': str(headers),
+        'Headers Received': '',
+        'Page Title': '',
+        'Content Length': 0,
+        'Number of Links': 0,
+        'Number of PDFs': 0,
+        'First PDF URL': '',
+        'Redirected URL': '',
+        'User-Agent': headers['User-Agent'],
+        'Cookies Sent': '',
+        'Cookies Received': '',
+        'Changed since last run': '',
+        'Pages Crawled': 0,
+        'Crawled Bytes': 0,
+        'Tokens Saved by Dedup': 0,
+        # Stage timings (in seconds) and sizes, see metrics.py for the run-wide totals
+        'Queue Time (s)': None,
+        'DNS Time (s)': None,
+        'Connect Time (s)': None,
+        'Wait Time (s)': None,
+        'Download Time (s)': None,
+        'Bytes Downloaded': 0,
+        'Parse Time (s)': None,
+        'Crawl Time (s)': None,
+        'PDF Time (s)': None,
+        'PDF Bytes': 0,
+        'LLM Time (s)': None,
+        'Chunks Dropped': 0,  # Text chunks beyond scrapping.MAX_CHUNKS that the LLM never saw
+        'Rendered with Browser': 'No',
+        'Render Time (s)': None,
+    }
+
+    # Send a conditional request when the page is already in the HTTP cache
+    cached = cache.get(url) if cache else None
+    request_headers = {**headers, **http_cache.conditional_headers(cached)}
+    log_entry['Headers Sent'] = str(request_headers)
+
+    cookies_sent = {}
+    while retries < max_retries:
+        retry_headers = None
+        try:
+            response = await engine.fetch(url, headers=request_headers, timeout=timeout, cookies=cookies_sent)
+            log_entry['Response Code'] = response.status_code
+            log_entry['Response Time'] = round(time.time() - start_time, 2)  # in seconds
+            log_entry['Headers Received'] = str(response.headers)
+            log_entry['Cookies Received'] = str(response.cookies)
+            log_entry['Queue Time (s)'] = response.timings.get('queue')
+            log_entry['DNS Time (s)'] = response.timings.get('dns')
+            log_entry['Connect Time (s)'] = response.timings.get('connect')
+            log_entry['Wait Time (s)'] = response.timings.get('wait')
+            log_entry['Download Time (s)'] = response.timings.get('download')
+            log_entry['Bytes Downloaded'] = len(response.content)
+
+            if response.status_code == 200 or (response.status_code == 304 and cached):
+                metrics.observe('fetch', time.time() - start_time)
+                return response, log_entry
+            else:
+                log_entry['Status'] = 'Failed'
+                log_entry['Description'] = f"Received {response.status_code} response"
+                if not retry_policy.is_transient_status(response.status_code):
+                    log_entry['Error Class'] = 'Permanent'
+                    break  # A 404 or 403 will not change on retry
+                log_entry['Error Class'] = 'Transient'
+                retry_headers = response.headers  # May carry Retry-After
+        except fetch_engine.PermanentFetchError as e:
+            log_entry['Status'] = 'Error'
+            log_entry['Description'] = str(e)
+            log_entry['Error Class'] = 'Circuit Open' if isinstance(e, fetch_engine.CircuitOpenError) else 'Permanent'
+            break  # DNS, TLS and dead domains fail fast
+        except fetch_engine.FetchTimeout:
+            log_entry['Status'] = 'Error'
+            log_entry['Description'] = 'Request timed out'
+            log_entry['Error Class'] = 'Transient'
+        except fetch_engine.FetchError as e:
+            log_entry['Status'] = 'Error'
+            log_entry['Description'] = str(e)
+            log_entry['Error Class'] = 'Transient'
+
+        retries += 1
+        log_entry['Retries'] = retries
+        if retries < max_retries:
+            metrics.increment('fetch_retries')
+            # Jittered backoff on the engine loop: no worker thread waits while the retry is pending
+            await asyncio.sleep(retry_policy.retry_delay(retries - 1, retry_headers))
+
+    metrics.observe('fetch', time.time() - start_time)
+    metrics.increment('fetch_failures')
+    if log_entry['Error Class'] != 'Transient':
+        metrics.increment('fetch_fast_failures')
+    return None, log_entry
+
+
+# Log entry fields derived from the page, reused when the page is unchanged
+PAGE_FIELDS = ['Page Title', 'Content Length', 'Number of Links', 'Number of PDFs', 'First PDF URL']
+
+
+# Function to parse a fetched page and fill in the content fields of the log entry
+def parse_website(response, log_entry, cache=None):
+    url = log_entry['Website']
+    cached = cache.get(url) if cache else None
+    content_hash = None if response.status_code == 304 else http_cache.body_hash(response.content)
+    log_entry['Redirected URL'] = response.url if response.history else 'N/A'
+
+    if cached and (response.status_code == 304 or content_hash == cached['body_hash']):
+        # Page unchanged since last run: reuse the cached text and page fields
+        data = cached['data']
+        for field in PAGE_FIELDS:
+            log_entry[field] = data[field]
+        if content_hash:
+            cache.put(url, response.headers, content_hash, data)  # Refresh the validators
+        log_entry['Changed since last run'] = 'No'
+        log_entry['Status'] = 'Success'
+        log_entry['Description'] = 'Website unchanged since last run'
+        page = html_extract.ExtractedPage(data['Text'], data['Page Title'], data.get('Links', data['PDF Links']), data['Number of Links'])
+        return page.text, page, log_entry
+
+    # Single pass over the page: visible text without scripts, styles and menus, title and links
+    with metrics.span('parse', log_entry, 'Parse Time (s)'):
+        page = html_extract.extract_page(response.text)
+    text = page.text
+
+    log_entry['Page Title'] = page.title
+    log_entry['Content Length'] = len(text)
+    log_entry['Number of Links'] = page.link_count
+    log_entry['Number of PDFs'] = len(page.pdf_links)
+    log_entry['First PDF URL'] = page.pdf_links[0] if page.pdf_links else 'N/A'
+
+    log_entry['Changed since last run'] = 'Yes' if cached else 'New'
+    if cache:
+        data = {field: log_entry[field] for field in PAGE_FIELDS}
+        data['Text'] = text
+        data['Links'] = page.links
+        data['PDF Links'] = page.pdf_links
+        cache.put(url, response.headers, content_hash, data)
+
+    log_entry['Status'] = 'Success'
+    log_entry['Description'] = 'Website scraped successfully'
+    return text, page, log_entry
+
+
+# Function to scrape the website content with logging and retry mechanism
+def scrape_website(url, company_name='', max_retries=3, timeout=FETCH_TIMEOUT, engine=None, cache=None):
+    engine = engine or fetch_engine.get_engine()
+    cache = cache or http_cache.get_http_cache()
+    response, log_entry = engine.run(fetch_website(url, engine, company_name, max_retries, timeout, cache))
+    if response is None:
+        return "", None, log_entry
+    return parse_website(response, log_entry, cache)
+
+
+# Function to scrape PDF content from website
+def scrape_pdfs(page, base_url, pdf_links=None, cache=None, log_entry=None, pdf_stage=None):
+    if page is not None:
+        pdf_links = page.pdf_links
+    if not pdf_links:
+        return []
+    # Downloads run concurrently with size and time caps, parsing happens in a process pool
+    pdf_stage = pdf_stage or pdf_pipeline.get_pdf_stage()
+    if cache and pdf_stage.cache is None:
+        pdf_stage.cache = cache
+    with metrics.span('pdfs', log_entry, 'PDF Time (s)'):
+        return pdf_stage.scrape(pdf_links, base_url, log_entry)
+
+
+# Function to generate a company profile
+def generate_profile(company_name, url, linkedin_url, text, pdf_texts):
+    profile = {
+        "Company": company_name,
+        "Website": url,
+        "Person LinkedIn URL": linkedin_url,  # Changed to Personal LinkedIn URL
+        "Website Text": text,
+        "PDF Text": ' '.join(pdf_texts)  # Join PDF texts into a single string
+    }
+    return profile
+
+
+# Function to render the homepage in a headless browser when static extraction found too little text
+# (JS-heavy sites); the rendered text replaces the static one in the HTTP cache so unchanged pages are not rendered again
+def render_if_sparse(url, text, page, log_entry, cache=None, renderer=None):
+    if renderer is None or not renderer.enabled or page is None or len(text) >= render_pool.MIN_STATIC_TEXT:
+        return text, page
+    cached = cache.get(url) if cache else None
+    if cached and cached['data'].get('Rendered') and log_entry['Changed since last run'] == 'No':
+        return text, page  # Rendered on an earlier run without getting more text
+    homepage_url = log_entry['Redirected URL'] if log_entry['Redirected URL'] != 'N/A' else url
+    with metrics.span('render_fallback', log_entry, 'Render Time (s)'):
+        html = renderer.render(homepage_url)
+    if html is None:
+        return text, page
+    metrics.increment('render_fallbacks')
+    log_entry['Rendered with Browser'] = 'Yes'
+    rendered = html_extract.extract_page(html)
+    if len(rendered.text) > len(text):
+        text, page = rendered.text, rendered
+        log_entry['Page Title'] = rendered.title or log_entry['Page Title']
+        log_entry['Content Length'] = len(text)
+        log_entry['Number of Links'] = rendered.link_count
+        log_entry['Number of PDFs'] = len(rendered.pdf_links)
+        log_entry['First PDF URL'] = rendered.pdf_links[0] if rendered.pdf_links else 'N/A'
+    if cached:
+        data = {field: log_entry[field] for field in PAGE_FIELDS}
+        data.update({'Text': text, 'Links': page.links, 'PDF Links': page.pdf_links, 'Rendered': True})
+        cache.put(url, {'ETag': cached['etag'], 'Last-Modified': cached['last_modified']}, cached['body_hash'], data)
+    return text, page
+
+
+# Function to process a single company (optionally from an already fetched response), returns (profile or None, log entry)
+def process_company(row, fetched=None, cache=None, pdf_stage=None, site_crawler=None, renderer=None):
+    url = row['Website']
+    linkedin_url = row['Person LinkedIn Url']
+    company_name = row['Company']  # Read company name from the input row
+
+    cache = cache or http_cache.get_http_cache()
+    print(f"Processing {company_name} at {url}...")  # Runs in a worker thread, outside the Streamlit script
+    if fetched is None:
+        text, page, log_entry = scrape_website(url, company_name, cache=cache)
+    else:
+        response, log_entry = fetched
+        text, page, log_entry = parse_website(response, log_entry, cache) if response is not None else ("", None, log_entry)
+    text, page = render_if_sparse(url, text, page, log_entry, cache, renderer)
+
+    if page is not None and site_crawler is not None:
+        # Crawl the most relevant same-domain pages within the page and byte budget
+        homepage_url = log_entry['Redirected URL'] if log_entry['Redirected URL'] != 'N/A' else url
+        with metrics.span('crawl', log_entry, 'Crawl Time (s)'):
+            crawl_result = site_crawler.crawl(homepage_url, page, headers={'User-Agent': log_entry['User-Agent']})
+        page = crawl_result.merged_page()
+        text = page.text
+        log_entry['Pages Crawled'] = len(crawl_result.pages)
+        log_entry['Crawled Bytes'] = crawl_result.crawled_bytes
+        if crawl_result.changed_pages and log_entry['Changed since last run'] == 'No':
+            log_entry['Changed since last run'] = 'Yes'  # A crawled page changed
+    pdf_texts = scrape_pdfs(page, url, cache=cache, log_entry=log_entry, pdf_stage=pdf_stage)
+
+    if text:
+        profile = generate_profile(company_name, url, linkedin_url, text, pdf_texts)
+        # Drop repeated footers, banners and brochure sections before they reach the LLM
+        with metrics.span('dedup'):
+            log_entry['Tokens Saved by Dedup'] = dedup.dedup_profile(profile)
+        return profile, log_entry
+    else:
+        print(f"No content found for {url}.")
+        return None, log_entry
+
+
+# Function to analyze a single profile with LLM, timed into the log entry when one is given
+# (key_pool: the run's own API keys, the shared pool of scrapping.py when None)
+def analyze_profile(profile, pdf_llm_executor, text_spill=None, log_entry=None, key_pool=None):
+    if text_spill:
+        text_spill.restore(profile)  # Large texts wait on disk while the profile is queued
+    print(f"Analyzing {profile['Company']} with LLM...")
+    with metrics.span('llm', log_entry, 'LLM Time (s)'):
+        return _analyze_profile(profile, pdf_llm_executor, key_pool, log_entry)
+
+
+# Function to run the LLM analyses of a profile, website and PDF analyses side by side
+def _analyze_profile(profile, pdf_llm_executor, key_pool=None, log_entry=None):
+    if scrapping.OUTPUT_FORMAT == 'json':
+        # One call for both sources, answered as JSON and flattened into one column per section
+        profile.update(scrapping.Analyze_structured(profile['Website Text'], profile['PDF Text'], pool=key_pool, log_entry=log_entry))
+        return profile
+    # Empty sources are not sent to the model
+    pdf_future = pdf_llm_executor.submit(scrapping.Analyze_scrap, profile['PDF Text'], pool=key_pool,
+                                         log_entry=log_entry) if profile['PDF Text'] else None
+    website_analysis = scrapping.Analyze_scrap(profile['Website Text'], pool=key_pool, log_entry=log_entry) if profile['Website Text'] else ''
+    profile['Signals'] = {
+        "Website Analysis": website_analysis,
+        "PDF Analysis": pdf_future.result() if pdf_future else ''
+    }
+    return profile
+
+
+# Function to run the whole pipeline over an input CSV into a checkpoint store: domains already completed
+# in the store are skipped, messages go to report and the number of finished rows to progress; LLM calls
+# use key_pool when given, and every thread of the run records into the caller's metrics registry
+def run_pipeline(file_path, store, num_threads=5, max_connections=200, max_per_host=4, llm_workers=4, max_in_flight=500,
+                 chunksize=1000, max_pages=crawler.MAX_PAGES, max_crawl_bytes=crawler.MAX_CRAWL_BYTES, pdf_workers=None,
+                 render_browsers=render_pool.BROWSERS, fetch_timeout=FETCH_TIMEOUT, report=print, progress=None, key_pool=None):
+    cache = http_cache.get_http_cache()
+    run_metrics = metrics.current()
+    bind_metrics = {'initializer': metrics.bind, 'initargs': (run_metrics,)}
+
+    # Contact rows, profiles and logs are streamed to the checkpoint store, a rerun skips finished domains
+    completed_domains = store.completed_domains()
+    if completed_domains or store.resumed:
+        report(f"Resuming: {len(completed_domains)} domains already done, {len(store.failed_domains())} failed ones are retried")
+    rows = iter_company_data(file_path, chunksize)
+    rows_exhausted = False
+    completed = 0
+    in_flight = {}  # domain -> first contact row, at most max_in_flight at a time
+    in_flight_rows = {}  # domain -> number of contact rows waiting on it
+    pending_logs = {}  # Log entries of domains still being processed
+    new_contacts = []
+
+    # Step 1: Fetch websites concurrently on the async engine, parse them in the thread pool
+    # Step 2: Stream each finished profile straight into the bounded LLM stage
+    with fetch_engine.FetchEngine(max_connections=max_connections, max_per_host=max_per_host) as engine, \
+            pdf_pipeline.PDFStage(engine, cache, max_workers=pdf_workers) as pdf_stage, \
+            render_pool.RenderPool(render_browsers) as renderer, \
+            spill.TextSpill() as text_spill, \
+            ThreadPoolExecutor(max_workers=num_threads, **bind_metrics) as executor, \
+            ThreadPoolExecutor(max_workers=llm_workers, **bind_metrics) as llm_executor, \
+            ThreadPoolExecutor(max_workers=llm_workers, **bind_metrics) as pdf_llm_executor:
+        engine.loop.call_soon_threadsafe(metrics.bind, run_metrics)  # Fetch, crawl and PDF download timings
+        site_crawler = crawler.SiteCrawler(engine, max_pages=max_pages, max_bytes=max_crawl_bytes, cache=cache)
+        stages = {}
+        pending = set()
+        while True:
+            # Read more input only while there is room in flight (backpressure on the CSV reader)
+            while not rows_exhausted and len(in_flight) < max_in_flight:
+                row_id, row = next(rows, (None, None))
+                if row is None:
+                    rows_exhausted = True
+                    break
+                domain = retry_policy.normalize_domain(row['Website'])
+                new_contacts.append((row_id, domain, row))
+                if domain in completed_domains:
+                    completed += 1
+                    continue
+                in_flight_rows[domain] = in_flight_rows.get(domain, 0) + 1
+                if domain in in_flight:
+                    continue  # Each domain is scraped and analyzed once, rows are fanned out on export
+                in_flight[domain] = row
+                future = engine.submit(fetch_website(row['Website'], engine, row['Company'], timeout=fetch_timeout, cache=cache))
+                stages[future] = ('fetch', domain)
+                pending.add(future)
+            if new_contacts:
+                store.add_contacts(new_contacts)
+                new_contacts = []
+            if progress:
+                progress(completed)
+            if not pending:
+                break
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, domain = stages.pop(future)
+                row = in_flight[domain]
+                next_future = None
+                try:
+                    if stage == 'fetch':
+                        fetched = future.result()
+                        pending_logs[domain] = fetched[1]
+                        next_future = executor.submit(process_company, row, fetched, cache, pdf_stage, site_crawler, renderer)
+                        stages[next_future] = ('scrape', domain)
+                    elif stage == 'scrape':
+                        profile, log_entry = future.result()
+                        if profile:
+                            next_future = llm_executor.submit(analyze_profile, text_spill.spill(profile), pdf_llm_executor, text_spill,
+                                                              log_entry, key_pool)
+                            stages[next_future] = ('llm', domain)
+                        else:
+                            store.complete(domain, pending_logs[domain], failed=pending_logs[domain]['Status'] != 'Success')
+                    else:
+                        store.complete(domain, pending_logs[domain], future.result())
+                except Exception as e:
+                    # A failing company (rate limit on the last attempt, blocked or malformed LLM answer, locked
+                    # database) ends with an error row in the logs instead of aborting the run
+                    report(f"Error processing {row['Company']}: {e}")
+                    metrics.increment('company_errors')
+                    log_entry = pending_logs.get(domain) or {'Website': row['Website'], 'Company Name': row['Company'],
+                                                             'Domain': urlparse(row['Website']).netloc}
+                    log_entry['Status'] = 'Error'
+                    log_entry['Description'] = f"{stage} stage failed: {type(e).__name__}: {e}"
+                    try:
+                        store.complete(domain, log_entry, failed=True)
+                    except Exception as store_error:
+                        report(f"Could not record the error of {row['Company']}: {store_error}")
+                if next_future is not None:
+                    pending.add(next_future)
+                else:
+                    del in_flight[domain]
+                    pending_logs.pop(domain, None)
+                    completed_domains.add(domain)
+                    completed += in_flight_rows.pop(domain)
+
+    open_circuits = engine.breaker.open_domains()
+    if open_circuits:
+        report(f"Circuit still open for {len(open_circuits)} failing domains: {', '.join(open_circuits[:20])}")
+    contact_rows, unique_domains = store.contact_stats()
+    report(f"Scraped {unique_domains} unique domains for {contact_rows} rows")
+    return store
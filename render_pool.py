@@ -0,0 +1,165 @@
+import os
+import queue
+import shutil
+import threading
+import time
+import metrics
+
+try:
+    from selenium import webdriver
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.chrome.service import Service
+except ImportError:
+    webdriver = None
+
+# Pages whose static text is shorter than this (in characters) are rendered in a browser
+MIN_STATIC_TEXT = int(os.getenv('RENDER_MIN_TEXT', '500'))
+BROWSERS = int(os.getenv('RENDER_BROWSERS', '2'))  # 0 disables the fallback
+PAGE_TIMEOUT = 20  # seconds for a page load
+SETTLE_TIMEOUT = 5  # seconds to wait for client-side rendering to stop adding text
+PAGES_PER_BROWSER = 50  # A browser is replaced after this many pages to bound its memory
+# Requests the browser never makes: images, fonts, media and common trackers
+BLOCKED_URLS = ['*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico', '*.bmp', '*.avif',
+                '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot', '*.mp4', '*.webm', '*.mp3', '*.m3u8',
+                '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*', '*facebook.net*', '*hotjar.com*']
+
+
+# Small pool of reused headless Chrome instances for JS-heavy sites: browsers start on first use,
+# each render borrows one, and a browser is recycled after PAGES_PER_BROWSER pages or any error
+class RenderPool:
+    def __init__(self, size=BROWSERS, page_timeout=PAGE_TIMEOUT, settle_timeout=SETTLE_TIMEOUT,
+                 pages_per_browser=PAGES_PER_BROWSER, user_agent=None):
+        self.size = size if webdriver is not None else 0
+        self.page_timeout = page_timeout
+        self.settle_timeout = settle_timeout
+        self.pages_per_browser = pages_per_browser
+        self.user_agent = user_agent
+        self.idle = queue.LifoQueue()  # (driver, pages rendered), the most recently used browser first
+        self.lock = threading.Lock()
+        self.started = 0
+        self.closed = False
+        if size and webdriver is None:
+            print("selenium is not installed, JS-heavy sites are not rendered")
+
+    @property
+    def enabled(self):
+        return self.size > 0
+
+    def _start_browser(self):
+        options = webdriver.ChromeOptions()
+        for argument in ('--headless=new', '--no-sandbox', '--disable-dev-shm-usage', '--disable-gpu', '--disable-extensions',
+                         '--blink-settings=imagesEnabled=false', '--window-size=1280,2000'):
+            options.add_argument(argument)
+        if self.user_agent:
+            options.add_argument(f'--user-agent={self.user_agent}')
+        options.page_load_strategy = 'eager'  # Return at DOMContentLoaded, the settle loop waits for rendering
+        binary = os.getenv('CHROME_BINARY') or shutil.which('chromium') or shutil.which('chromium-browser')
+        if binary:
+            options.binary_location = binary
+        driver_path = os.getenv('CHROMEDRIVER_PATH') or shutil.which('chromedriver')
+        service = Service(executable_path=driver_path) if driver_path else Service()
+        driver = webdriver.Chrome(service=service, options=options)
+        driver.set_page_load_timeout(self.page_timeout)
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URLS})
+        metrics.increment('browser_starts')
+        return driver
+
+    # Borrow an idle browser, start one while the pool is below its size, otherwise wait for one
+    def _acquire(self):
+        while True:
+            if not self.enabled or self.closed:
+                return None, 0
+            try:
+                return self.idle.get_nowait()
+            except queue.Empty:
+                pass
+            with self.lock:
+                start = self.started < self.size
+                if start:
+                    self.started += 1
+            if start:
+                try:
+                    return self._start_browser(), 0
+                except Exception:
+                    with self.lock:
+                        self.started -= 1
+                    raise
+            try:
+                return self.idle.get(timeout=1)  # Also wakes up to take the slot of a recycled browser
+            except queue.Empty:
+                continue
+
+    def _release(self, driver, pages, healthy):
+        if healthy and not self.closed and pages < self.pages_per_browser:
+            self.idle.put((driver, pages))
+            return
+        try:
+            driver.quit()
+        except Exception:
+            pass
+        with self.lock:
+            self.started -= 1
+        metrics.increment('browser_recycles')
+
+    # Wait until client-side rendering stops adding text to the page, or settle_timeout passes
+    def _settle(self, driver):
+        deadline = time.time() + self.settle_timeout
+        last_length = -1
+        while time.time() < deadline:
+            length = driver.execute_script('return document.body ? document.body.innerText.length : 0')
+            if length == last_length and length > 0:
+                return
+            last_length = length
+            time.sleep(0.5)
+
+    # Function to render a URL and return the HTML after scripts ran, or None when rendering failed
+    def render(self, url):
+        if not self.enabled or self.closed:
+            return None
+        try:
+            driver, pages = self._acquire()
+        except Exception as e:
+            # Without a working browser every sparse page would pay for a failed start
+            print(f"Could not start a browser, rendering is disabled: {e}")
+            self.size = 0
+            return None
+        if driver is None:
+            return None
+        healthy = True
+        try:
+            with metrics.span('render'):
+                try:
+                    driver.get(url)
+                except TimeoutException:
+                    driver.execute_script('window.stop();')  # Keep what loaded within the page timeout
+                self._settle(driver)
+                html = driver.page_source
+            pages += 1
+            driver.get('about:blank')  # Drop the page's scripts and memory before the next site
+            return html
+        except Exception as e:
+            print(f"Error rendering {url}: {getattr(e, 'msg', None) or e}")
+            healthy = False
+            return None
+        finally:
+            self._release(driver, pages, healthy)
+
+    def close(self):
+        self.closed = True
+        while True:
+            try:
+                driver, _ = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
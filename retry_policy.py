@@ -0,0 +1,105 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+# Statuses worth another attempt: timeouts, rate limits and server-side failures
+TRANSIENT_STATUSES = {408, 425, 429, 500, 502, 503, 504, 520, 521, 522, 523, 524}
+BASE_DELAY = 1.0  # seconds before the first retry (before jitter)
+MAX_DELAY = 30.0
+FAILURE_THRESHOLD = 5  # consecutive failures before a domain's circuit opens
+RESET_TIMEOUT = 60.0  # seconds an open circuit rejects requests before letting one probe through
+
+
+# Function to decide whether a response status is worth retrying (anything else non-2xx/304 fails fast)
+def is_transient_status(status_code):
+    return status_code in TRANSIENT_STATUSES
+
+
+# Function to compute a jittered exponential backoff ("full jitter"), honoring Retry-After when the server sent one
+def retry_delay(attempt, headers=None, base=BASE_DELAY, cap=MAX_DELAY):
+    retry_after = _retry_after(headers) if headers else None
+    if retry_after is not None:
+        return min(retry_after, cap)
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def _retry_after(headers):
+    value = next((value for key, value in headers.items() if key.lower() == 'retry-after'), None)
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+# Function to normalize a website to its domain (host and port, without www. or a default port):
+# the key for input deduplication, the crawl scope and the circuit breaker
+def normalize_domain(url):
+    url = url.strip()
+    if '://' not in url:
+        url = 'http://' + url
+    domain = urlparse(url).netloc.lower().split('@')[-1]
+    for default_port in (':80', ':443'):
+        domain = domain[:-len(default_port)] if domain.endswith(default_port) else domain
+    return domain[4:] if domain.startswith('www.') else domain
+
+
+# Per-domain circuit breaker: after FAILURE_THRESHOLD consecutive failures a domain is rejected
+# for reset_timeout seconds, then a single probe request decides whether it closes again
+# (an unsuccessful probe reopens it for twice as long, up to max_reset_timeout)
+class CircuitBreaker:
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT, max_reset_timeout=600):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.lock = threading.Lock()
+        self.domains = {}  # domain -> {'failures', 'open_until', 'timeout', 'probing'}
+
+    def _state(self, domain):
+        state = self.domains.get(domain)
+        if state is None:
+            state = self.domains[domain] = {'failures': 0, 'open_until': 0, 'timeout': self.reset_timeout, 'probing': False}
+        return state
+
+    # Function to check whether a request to the domain may be sent now
+    def allow(self, domain):
+        with self.lock:
+            state = self.domains.get(domain)
+            if state is None or state['failures'] < self.failure_threshold:
+                return True
+            if time.time() < state['open_until'] or state['probing']:
+                return False
+            state['probing'] = True  # Half-open: let one request through
+            return True
+
+    def record_success(self, domain):
+        with self.lock:
+            state = self.domains.pop(domain, None)
+            if state is not None and state['probing']:
+                print(f"Circuit closed for {domain}")
+
+    def record_failure(self, domain):
+        with self.lock:
+            state = self._state(domain)
+            state['failures'] += 1
+            if state['probing']:
+                state['timeout'] = min(state['timeout'] * 2, self.max_reset_timeout)
+                state['probing'] = False
+            elif state['failures'] != self.failure_threshold:
+                return
+            state['open_until'] = time.time() + state['timeout']
+            print(f"Circuit open for {domain} for {state['timeout']:.0f}s after {state['failures']} failures")
+
+    # Domains currently rejecting requests, for the run logs
+    def open_domains(self):
+        with self.lock:
+            now = time.time()
+            return sorted(domain for domain, state in self.domains.items()
+                          if state['failures'] >= self.failure_threshold and state['open_until'] > now)
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import pandas as pd
+
+
+# Columns copied from each contact row onto its domain's profile when exporting
+CONTACT_FIELDS = {'Company': 'Company', 'Website': 'Website', 'Person LinkedIn URL': 'Person LinkedIn Url'}
+
+
+# Function to fingerprint an input file by its content, so a checkpoint is only resumed for the same input
+def input_fingerprint(file_path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+# Append-only checkpoint store for a run: contact rows are written as they are read, and
+# one profile and log entry per company domain as it completes, so a restarted run only
+# processes the remaining domains and nothing has to stay in memory until the end.
+# The store is kept only with resume=True and when it was written for the same input_key,
+# otherwise it starts empty; failed domains are recorded apart and processed again on resume
+class RunStore:
+    def __init__(self, path, input_key=None, resume=False):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS records (id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT, domain TEXT, data TEXT)'
+        )
+        self.connection.execute('CREATE TABLE IF NOT EXISTS completed (domain TEXT PRIMARY KEY)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS failed (domain TEXT PRIMARY KEY)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS contacts (row_id INTEGER PRIMARY KEY, domain TEXT, data TEXT)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS records_kind_domain ON records (kind, domain)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS contacts_domain ON contacts (domain)')
+        self.connection.commit()
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'input_key'").fetchone()
+        self.resumed = resume and row is not None and row[0] == input_key
+        if not self.resumed:
+            if row is not None and resume:
+                print(f"{path} belongs to another input, starting a new run")
+            self.reset(input_key)
+
+    # Drop everything stored, e.g. a finished or unrelated earlier run, and tag the store with its input
+    def reset(self, input_key=None):
+        with self.lock:
+            with self.connection:
+                for table in ('records', 'completed', 'failed', 'contacts', 'meta'):
+                    self.connection.execute(f'DELETE FROM {table}')
+                self.connection.execute("INSERT INTO meta (key, value) VALUES ('input_key', ?)", (input_key,))
+
+    # Domains finished by this or an earlier (crashed) run, failed ones excluded so they are retried
+    def completed_domains(self):
+        with self.lock:
+            return {row[0] for row in self.connection.execute('SELECT domain FROM completed')}
+
+    # Domains whose last attempt failed
+    def failed_domains(self):
+        with self.lock:
+            return {row[0] for row in self.connection.execute('SELECT domain FROM failed')}
+
+    # Record input rows as (row_id, domain, row) tuples; rows already stored by the resumed run are ignored
+    def add_contacts(self, contacts):
+        with self.lock:
+            with self.connection:
+                self.connection.executemany(
+                    'INSERT OR IGNORE INTO contacts (row_id, domain, data) VALUES (?, ?, ?)',
+                    [(row_id, domain, json.dumps(dict(row), default=str)) for row_id, domain, row in contacts],
+                )
+
+    # Number of contact rows and unique domains seen so far
+    def contact_stats(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*), COUNT(DISTINCT domain) FROM contacts').fetchone()
+
+    # Record a finished domain: its log entry, its profile and the completion (or failure) marker in one
+    # transaction; the records of an earlier failed attempt are replaced
+    def complete(self, domain, log_entry, profile=None, failed=False):
+        with self.lock:
+            with self.connection:
+                self.connection.execute("DELETE FROM records WHERE kind IN ('log', 'profile') AND domain = ?", (domain,))
+                self.connection.execute(
+                    'INSERT INTO records (kind, domain, data) VALUES (?, ?, ?)', ('log', domain, json.dumps(log_entry, default=str))
+                )
+                if profile is not None:
+                    self.connection.execute(
+                        'INSERT INTO records (kind, domain, data) VALUES (?, ?, ?)', ('profile', domain, json.dumps(profile, default=str))
+                    )
+                if failed:
+                    self.connection.execute('INSERT OR IGNORE INTO failed (domain) VALUES (?)', (domain,))
+                else:
+                    self.connection.execute('DELETE FROM failed WHERE domain = ?', (domain,))
+                    self.connection.execute('INSERT OR IGNORE INTO completed (domain) VALUES (?)', (domain,))
+
+    def count(self, kind):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM records WHERE kind = ?', (kind,)).fetchone()[0]
+
+    # Iterate stored records of one kind ('profile' or 'log') in completion order, in batches
+    def iter_records(self, kind, batch_size=1000):
+        last_id = 0
+        while True:
+            with self.lock:
+                rows = self.connection.execute(
+                    'SELECT id, domain, data FROM records WHERE kind = ? AND id > ? ORDER BY id LIMIT ?', (kind, last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            if kind == 'log':
+                rows_per_domain = self._rows_per_domain({domain for _, domain, _ in rows})
+            for _, domain, data in rows:
+                record = json.loads(data)
+                if kind == 'log':
+                    record['Rows Sharing Domain'] = rows_per_domain.get(domain, 0)
+                yield record
+            last_id = rows[-1][0]
+
+    # Iterate one profile per contact row in input order, fanning each domain's profile out
+    def iter_contact_profiles(self, batch_size=1000):
+        last_row_id = -1
+        while True:
+            with self.lock:
+                contacts = self.connection.execute(
+                    'SELECT row_id, domain, data FROM contacts WHERE row_id > ? ORDER BY row_id LIMIT ?', (last_row_id, batch_size)
+                ).fetchall()
+                domains = list({domain for _, domain, _ in contacts})
+                placeholders = ','.join('?' * len(domains))
+                profiles = dict(self.connection.execute(
+                    f"SELECT domain, data FROM records WHERE kind = 'profile' AND domain IN ({placeholders})", domains
+                ).fetchall()) if domains else {}
+            if not contacts:
+                return
+            for _, domain, data in contacts:
+                if domain in profiles:
+                    profile = json.loads(profiles[domain])
+                    row = json.loads(data)
+                    for profile_field, row_field in CONTACT_FIELDS.items():
+                        profile[profile_field] = row[row_field]
+                    yield profile
+            last_row_id = contacts[-1][0]
+
+    def _rows_per_domain(self, domains):
+        domains = list(domains)
+        placeholders = ','.join('?' * len(domains))
+        with self.lock:
+            return dict(self.connection.execute(
+                f'SELECT domain, COUNT(*) FROM contacts WHERE domain IN ({placeholders}) GROUP BY domain', domains
+            ).fetchall())
+
+    # Write profiles (one per contact row) or logs to CSV chunk by chunk, without holding the run in memory
+    def export_csv(self, kind, file_path, batch_size=1000):
+        records = self.iter_contact_profiles(batch_size) if kind == 'profile' else self.iter_records(kind, batch_size)
+        columns = None
+        written = 0
+        batch = []
+        with open(file_path, 'w', newline='', encoding='utf-8') as file:
+            for record in records:
+                batch.append(record)
+                if len(batch) == batch_size:
+                    columns = self._write_batch(file, batch, columns)
+                    written += len(batch)
+                    batch = []
+            if batch or columns is None:
+                columns = self._write_batch(file, batch, columns)
+                written += len(batch)
+        return written
+
+    def _write_batch(self, file, batch, columns):
+        df = pd.DataFrame(batch)
+        header = columns is None
+        if columns is None:
+            columns = list(df.columns)
+        df.reindex(columns=columns).to_csv(file, index=False, header=header)
+        return columns
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    # Close and delete the store once its run has been exported, so the next run starts fresh
+    def remove(self):
+        self.close()
+        for path in (self.path, self.path + '-wal', self.path + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
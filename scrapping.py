@@ -1,19 +1,18 @@
-import nltk
 from langchain_google_genai import ChatGoogleGenerativeAI
 from dotenv import load_dotenv
 import os
-import random
-import google.generativeai as genai
+import json
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import llm_cache
+import token_budget
+import metrics
 
-# Download NLTK data (if not already downloaded)
-nltk.download('punkt')
-
-# Function to limit text based on word count
-def limit_text_by_word_count(text, max_words):
-    words = nltk.word_tokenize(text)
-    if len(words) > max_words:
-        return ' '.join(words[:max_words])
-    return text
+# Function to limit text based on model token count (stops scanning once the budget is used)
+def limit_text_by_token_count(text, max_tokens):
+    return token_budget.truncate_to_token_budget(text, max_tokens)
 
 # Your prompt template
 template = """You are an expert in analyzing company websites to extract valuable information that will be used to create hyper-personalized emails for sales and marketing purposes. Your analysis will focus on key business aspects that can be leveraged to write effective emails, with the goal of improving deal closure rates and establishing strong business relationships.
@@ -42,16 +41,106 @@ template = """You are an expert in analyzing company websites to extract valuabl
     ### The goal is to ensure the information is structured in a way that helps craft personalized outreach, addressing the company's unique challenges and goals, and showcasing how we can provide value in a relevant and meaningful way.
     """
 
+# Prompt for one chunk of a long text (map step)
+chunk_template = """You are an expert in analyzing company websites to extract valuable information that will be used to create hyper-personalized emails for sales and marketing purposes.
+    The following text is one part of a longer document scraped from a company's website and PDFs. Extract only what this part says, with specific details (names, numbers, products, dates).
+
+    ### Scraped Text (part):
+    {text}
+
+    ---
+
+    ### Please provide the extracted information in the following structured format, writing "Not mentioned" for sections this part does not cover:
+
+    1. Company Overview
+    2. Products/Services
+    3. Target Audience/Market
+    4. Key Business Initiatives
+    5. Company Leadership & Team
+    6. Industry Position
+    7. Technology & Innovation
+    8. Financial Information
+    9. Recent News & Press Releases
+    10. Challenges or Pain Points
+    11. Opportunities for Engagement
+    """
+
+# Prompt merging the partial analyses of all chunks (reduce step)
+reduce_template = """You are an expert in analyzing company websites to extract valuable information that will be used to create hyper-personalized emails for sales and marketing purposes.
+    Below are partial analyses, each made from a different part of the same company's website and PDFs. Merge them into one analysis: combine the details of every part, drop duplicates and "Not mentioned" entries, and keep specific names, numbers and dates.
+
+    ### Partial Analyses:
+    {text}
+
+    ---
+
+    ### Please provide the merged information in the following structured format:
+
+    1. Company Overview
+    2. Products/Services
+    3. Target Audience/Market
+    4. Key Business Initiatives
+    5. Company Leadership & Team
+    6. Industry Position
+    7. Technology & Innovation
+    8. Financial Information
+    9. Recent News & Press Releases
+    10. Challenges or Pain Points
+    11. Opportunities for Engagement
+    ---
+
+    ### The goal is to ensure the information is structured in a way that helps craft personalized outreach, addressing the company's unique challenges and goals, and showcasing how we can provide value in a relevant and meaningful way.
+    """
+
+# The 11 sections, also the JSON keys of structured answers and the profile columns they are flattened into
+SECTIONS = [
+    "Company Overview",
+    "Products/Services",
+    "Target Audience/Market",
+    "Key Business Initiatives",
+    "Company Leadership & Team",
+    "Industry Position",
+    "Technology & Innovation",
+    "Financial Information",
+    "Recent News & Press Releases",
+    "Challenges or Pain Points",
+    "Opportunities for Engagement",
+]
+_json_schema = json.dumps({section: "string" for section in SECTIONS}, indent=4).replace('{', '{{').replace('}', '}}')
+
+# Prompt for one combined call on the website and PDF text, answered as JSON
+json_template = """You are an expert in analyzing company websites to extract valuable information that will be used to create hyper-personalized emails for sales and marketing purposes. Your analysis will focus on key business aspects that can be leveraged to write effective emails, with the goal of improving deal closure rates and establishing strong business relationships.
+    Please extract the relevant information from the following text (the company's website and, when available, its PDFs), making sure to include specific details about the company's operations, products, market focus, and any key points that could be used for personalized outreach.
+
+    ### Scraped Text:
+    {text}
+
+    ---
+
+    ### Respond with one JSON object and nothing else, with exactly these keys and a string value for each (an empty string when the text says nothing about it):
+""" + _json_schema + """
+    """
+
+# Prompt merging partial analyses into the JSON answer (final reduce step of structured analyses)
+json_reduce_template = """You are an expert in analyzing company websites to extract valuable information that will be used to create hyper-personalized emails for sales and marketing purposes.
+    Below are partial analyses, each made from a different part of the same company's website and PDFs. Merge them into one analysis: combine the details of every part, drop duplicates and "Not mentioned" entries, and keep specific names, numbers and dates.
+
+    ### Partial Analyses:
+    {text}
+
+    ---
+
+    ### Respond with one JSON object and nothing else, with exactly these keys and a string value for each (an empty string when no part says anything about it):
+""" + _json_schema + """
+    """
+
 load_dotenv()
 
-api_key1 = os.getenv('API_KEY1')
-#api_key2 = os.getenv('API_KEY2')
-#api_key3 = os.getenv('API_KEY3')
-#API_Vault = [api_key1, api_key2, api_key3]
-API_Vault = [api_key1]
-genai.configure(api_key=random.choice(API_Vault))
+# Load every configured key (API_KEY1 .. API_KEY5) from the environment
+API_Vault = [key for key in (os.getenv(f'API_KEY{i}') for i in range(1, 6)) if key]
 
 # Create the model
+model_name = "gemini-1.5-flash"
 generation_config = {
     "temperature": 1,
     "top_p": 0.95,
@@ -60,24 +149,353 @@ generation_config = {
     "response_mime_type": "text/plain",
 }
 
-model = genai.GenerativeModel(
-    model_name="gemini-1.5-flash",
-    generation_config=generation_config,
-)
+# Default per-key quotas (gemini-1.5-flash free tier)
+DEFAULT_RPM_LIMIT = 15
+DEFAULT_TPM_LIMIT = 1000000
+
+# Input limit of a single prompt (about 50000 words)
+MAX_INPUT_TOKENS = 65000
+
+# Long texts are split into chunks that are analyzed concurrently and merged in a reduce call
+# ('map_reduce'), or cut to MAX_INPUT_TOKENS and analyzed in one call ('truncate')
+ANALYSIS_MODE = os.getenv('LLM_ANALYSIS_MODE', 'map_reduce')
+# 'text' (default): separate free-text analyses of the website and the PDFs in the Signals column
+# 'json': one call per company with both sources, flattened into one column per section (no Signals column)
+OUTPUT_FORMAT = os.getenv('LLM_OUTPUT_FORMAT', 'text')
+CHUNK_TOKENS = int(os.getenv('LLM_CHUNK_TOKENS', '16000'))
+MAX_CHUNKS = int(os.getenv('LLM_MAX_CHUNKS', '32'))  # Text beyond this many chunks is dropped (counted in the logs)
+CHUNK_WORKERS = int(os.getenv('LLM_CHUNK_WORKERS', '8'))
+
+
+# Function to check whether an error is a 429 / quota exhausted answer from the Gemini API
+def is_rate_limit_error(error):
+    message = str(error)
+    return '429' in message or 'ResourceExhausted' in type(error).__name__ or 'quota' in message.lower()
+
+
+# Token estimate used for scheduling before the real usage is known
+def estimate_tokens(text):
+    return token_budget.count_tokens(text) + 1
+
+
+# Function to get the largest prompt analyze_text sends: a full MAX_INPUT_TOKENS text in the longest template
+def max_prompt_tokens():
+    templates = (template, chunk_template, reduce_template, json_template, json_reduce_template)
+    return MAX_INPUT_TOKENS + max(estimate_tokens(prompt.format(text='')) for prompt in templates)
+
+
+# Quota-aware pool of API keys: tracks requests and tokens per key over a sliding
+# minute, sends each call to the key with the most headroom and cools down keys on 429s
+class KeyPool:
+    def __init__(self, api_keys, rpm_limit=DEFAULT_RPM_LIMIT, tpm_limit=DEFAULT_TPM_LIMIT, window=60):
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        self.window = window
+        self.lock = threading.Lock()
+        self.keys = {}
+        for api_key in dict.fromkeys(api_keys):
+            self.keys[api_key] = {
+                'model': ChatGoogleGenerativeAI(
+                    model=model_name,
+                    google_api_key=api_key,
+                    temperature=generation_config['temperature'],
+                    top_p=generation_config['top_p'],
+                    top_k=generation_config['top_k'],
+                    max_output_tokens=generation_config['max_output_tokens'],
+                    max_retries=0,  # 429s are handled by the pool
+                ),
+                'requests': deque(),  # timestamps of requests in the window
+                'tokens': deque(),  # (timestamp, tokens) in the window
+                'cooldown_until': 0,
+                'consecutive_429s': 0,
+                'total_requests': 0,
+                'total_tokens': 0,
+                'rate_limited': 0,
+            }
+
+    def _prune(self, usage, now):
+        while usage['requests'] and usage['requests'][0] <= now - self.window:
+            usage['requests'].popleft()
+        while usage['tokens'] and usage['tokens'][0][0] <= now - self.window:
+            usage['tokens'].popleft()
+
+    # Block until a key has room for one more request of estimated_tokens, then reserve it
+    def acquire(self, estimated_tokens):
+        if not self.keys:
+            raise RuntimeError("No Gemini API keys configured")
+        estimated_tokens = min(estimated_tokens, self.tpm_limit)
+        while True:
+            with self.lock:
+                now = time.time()
+                best_key, best_headroom, next_free = None, 0, None
+                for api_key, usage in self.keys.items():
+                    self._prune(usage, now)
+                    if usage['cooldown_until'] > now:
+                        free_at = usage['cooldown_until']
+                    else:
+                        used_tokens = sum(tokens for _, tokens in usage['tokens'])
+                        request_headroom = (self.rpm_limit - len(usage['requests'])) / self.rpm_limit
+                        token_headroom = (self.tpm_limit - used_tokens - estimated_tokens) / self.tpm_limit
+                        # A prompt as large as the whole token quota fits once the key's window is empty
+                        if request_headroom > 0 and token_headroom >= 0:
+                            headroom = min(request_headroom, token_headroom)
+                            if best_key is None or headroom > best_headroom:
+                                best_key, best_headroom = api_key, headroom
+                            continue
+                        oldest = [usage['requests'][0]] if usage['requests'] else []
+                        oldest += [usage['tokens'][0][0]] if usage['tokens'] else []
+                        free_at = min(oldest) + self.window if oldest else now
+                    next_free = free_at if next_free is None else min(next_free, free_at)
+                if best_key is not None:
+                    usage = self.keys[best_key]
+                    reservation = (now, estimated_tokens)
+                    usage['requests'].append(now)
+                    usage['tokens'].append(reservation)
+                    usage['total_requests'] += 1
+                    return best_key, usage['model'], reservation
+            time.sleep(min(max(next_free - time.time(), 0.05), 1))
+
+    # Replace the token estimate of a reservation with the real usage
+    def record_usage(self, api_key, reservation, actual_tokens):
+        with self.lock:
+            usage = self.keys[api_key]
+            usage['consecutive_429s'] = 0
+            usage['total_tokens'] += actual_tokens
+            for i, entry in enumerate(usage['tokens']):
+                if entry is reservation:
+                    usage['tokens'][i] = (reservation[0], actual_tokens)
+                    break
+
+    # Back off a key after a 429 with an exponentially growing cooldown
+    def report_rate_limited(self, api_key):
+        with self.lock:
+            usage = self.keys[api_key]
+            usage['consecutive_429s'] += 1
+            usage['rate_limited'] += 1
+            usage['cooldown_until'] = time.time() + min(2 ** usage['consecutive_429s'], 60)
+
+    # Live per-key usage for the logs and the GUI
+    def usage(self):
+        with self.lock:
+            now = time.time()
+            rows = []
+            for api_key, usage in self.keys.items():
+                self._prune(usage, now)
+                rows.append({
+                    'Key': f"...{api_key[-4:]}",
+                    'Requests (last min)': len(usage['requests']),
+                    'Tokens (last min)': sum(tokens for _, tokens in usage['tokens']),
+                    'RPM Limit': self.rpm_limit,
+                    'TPM Limit': self.tpm_limit,
+                    'Cooldown (s)': round(max(usage['cooldown_until'] - now, 0), 1),
+                    'Total Requests': usage['total_requests'],
+                    'Total Tokens': usage['total_tokens'],
+                    '429s': usage['rate_limited'],
+                })
+            return rows
+
+
+key_pool = KeyPool(API_Vault)
+_key_pool_lock = threading.Lock()
+
+
+# Function to get the keys to use: the non-empty given keys (e.g. entered in the GUI), or the keys from .env
+def usable_api_keys(api_keys):
+    return list(dict.fromkeys([key.strip() for key in api_keys if key and key.strip()] or API_Vault))
+
+
+# Function to replace the keys used by Analyze_scrap when no pool is passed; the pool is kept
+# when keys and limits did not change
+def set_api_keys(api_keys, rpm_limit=DEFAULT_RPM_LIMIT, tpm_limit=DEFAULT_TPM_LIMIT):
+    global key_pool
+    api_keys = usable_api_keys(api_keys)
+    with _key_pool_lock:
+        if list(key_pool.keys) != api_keys or key_pool.rpm_limit != rpm_limit or key_pool.tpm_limit != tpm_limit:
+            key_pool = KeyPool(api_keys, rpm_limit, tpm_limit)
+        return key_pool
+
 
-def Analyze_scrap(text):
-    # Limit the input text to a maximum of 2000 words or adjust as needed
-    max_input_words = 50000
-    limited_text = limit_text_by_word_count(text, max_input_words)
+# Function to get live per-key usage
+def get_key_usage():
+    return key_pool.usage()
 
-    chat_session = model.start_chat(
-        history=[]
-    )
+
+# On-disk cache of Analyze_scrap results, opened on first use
+LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', 'llm_cache.sqlite')
+LLM_CACHE_MAX_MB = int(os.getenv('LLM_CACHE_MAX_MB', '500'))
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = llm_cache.LLMCache(LLM_CACHE_PATH, LLM_CACHE_MAX_MB * 1024 * 1024)
+        return _response_cache
+
+
+# Function to get the cache hit/miss counts for the run logs
+def get_cache_stats():
+    return get_response_cache().stats()
+
+
+# Shared pool for the chunk calls of map-reduce analyses, created on first use
+_chunk_executor = None
+_chunk_executor_lock = threading.Lock()
+
+
+def get_chunk_executor():
+    global _chunk_executor
+    with _chunk_executor_lock:
+        if _chunk_executor is None:
+            _chunk_executor = ThreadPoolExecutor(max_workers=CHUNK_WORKERS, thread_name_prefix='llm-chunk')
+        return _chunk_executor
+
+
+# Function to run one prompt on a text through the response cache and the key pool (the shared one unless pool is given)
+def analyze_text(prompt_template, text, max_input_tokens=MAX_INPUT_TOKENS, max_attempts=5, use_cache=True, validate=None, pool=None):
+    # Skip the model call when the same text was analyzed with the same prompt and config
+    cache_key = llm_cache.make_cache_key(text, prompt_template, {'model': model_name, **generation_config})
+    if use_cache:
+        cached_response = get_response_cache().get(cache_key)
+        if cached_response is not None:
+            metrics.increment('llm_cache_hits')
+            return cached_response
+
+    # Limit the input text to a maximum number of model tokens
+    with metrics.span('truncate'):
+        limited_text = limit_text_by_token_count(text, max_input_tokens)
 
     # Use the limited text in the prompt
-    prompt_text = template.format(text=limited_text)
-    
-    # Send the prompt to the model
-    response = chat_session.send_message(prompt_text)
+    prompt_text = prompt_template.format(text=limited_text)
+    estimated_tokens = estimate_tokens(prompt_text)
+
+    pool = pool or key_pool
+    for attempt in range(max_attempts):
+        with metrics.span('llm_key_wait'):  # Time spent waiting for quota
+            api_key, model, reservation = pool.acquire(estimated_tokens)
+        metrics.increment('llm_calls')
+        try:
+            # Send the prompt to the model with the key that has the most headroom
+            with metrics.span('llm_call'):
+                response = model.invoke(prompt_text)
+        except Exception as e:
+            if is_rate_limit_error(e) and attempt < max_attempts - 1:
+                pool.report_rate_limited(api_key)
+                metrics.increment('llm_rate_limited')
+                continue
+            raise
+        usage_metadata = getattr(response, 'usage_metadata', None) or {}
+        total_tokens = usage_metadata.get('total_tokens', estimated_tokens)
+        pool.record_usage(api_key, reservation, total_tokens)
+        metrics.increment('llm_tokens', total_tokens)
+        if validate is not None:
+            try:
+                validate(response.content)
+            except ValueError:
+                if attempt < max_attempts - 1:
+                    metrics.increment('llm_invalid_answers')
+                    continue  # Ask again instead of caching a malformed answer
+                raise
+        if use_cache:
+            get_response_cache().put(cache_key, response.content)
+        return response.content
+
+
+_log_entry_lock = threading.Lock()
+
+
+# Function to group partial analyses into batches that fit one reduce prompt
+def _batch_partials(partials, max_tokens):
+    batches, batch, used = [], [], 0
+    for partial in partials:
+        tokens = token_budget.count_tokens(partial)
+        if batch and used + tokens > max_tokens:
+            batches.append(batch)
+            batch, used = [], 0
+        batch.append(partial)
+        used += tokens
+    batches.append(batch)
+    return batches
+
+
+def _join_partials(partials):
+    return '\n\n'.join(f"#### Part {i}\n{partial}" for i, partial in enumerate(partials, 1))
+
+
+# Function to analyze a long text chunk by chunk in parallel and merge the results;
+# every chunk and reduce call goes through the response cache on its own. Chunks beyond
+# MAX_CHUNKS are not analyzed, their number is added to the log entry when one is given
+def analyze_map_reduce(text, max_attempts=5, use_cache=True, single_template=template, final_template=reduce_template, validate=None,
+                       pool=None, log_entry=None):
+    chunks = token_budget.split_by_token_budget(text, CHUNK_TOKENS)
+    if len(chunks) <= 1:
+        return analyze_text(single_template, text, max_attempts=max_attempts, use_cache=use_cache, validate=validate, pool=pool)
+    if len(chunks) > MAX_CHUNKS:
+        dropped = len(chunks) - MAX_CHUNKS
+        print(f"Text of {len(chunks)} chunks, analyzing the first {MAX_CHUNKS} and dropping {dropped}")
+        metrics.increment('llm_chunks_dropped', dropped)
+        if log_entry is not None:
+            with _log_entry_lock:  # The website and PDF analyses of a company may both truncate
+                log_entry['Chunks Dropped'] = (log_entry.get('Chunks Dropped') or 0) + dropped
+    executor = get_chunk_executor()
+    # The chunk pool is shared by all runs, each call records into the metrics of the run that made it
+    partials = list(executor.map(
+        metrics.bound(lambda chunk: analyze_text(chunk_template, chunk, CHUNK_TOKENS, max_attempts, use_cache, pool=pool)),
+        chunks[:MAX_CHUNKS]
+    ))
+    # Merge in rounds while the partial analyses do not fit a single prompt
+    while True:
+        batches = _batch_partials(partials, MAX_INPUT_TOKENS)
+        if len(batches) == 1:
+            return analyze_text(final_template, _join_partials(batches[0]), max_attempts=max_attempts, use_cache=use_cache,
+                                validate=validate, pool=pool)
+        partials = list(executor.map(
+            metrics.bound(lambda batch: analyze_text(reduce_template, _join_partials(batch), max_attempts=max_attempts,
+                                                     use_cache=use_cache, pool=pool)),
+            batches
+        ))
+
+
+def Analyze_scrap(text, max_attempts=5, use_cache=True, mode=None, pool=None, log_entry=None):
+    if (mode or ANALYSIS_MODE) == 'map_reduce' and len(text) > CHUNK_TOKENS:
+        return analyze_map_reduce(text, max_attempts, use_cache, pool=pool, log_entry=log_entry)
+    return analyze_text(template, text, max_attempts=max_attempts, use_cache=use_cache, pool=pool)
+
+
+# Function to validate a JSON answer and flatten it to one string per section
+def parse_sections(content):
+    start, end = content.find('{'), content.rfind('}')
+    if start == -1 or end < start:
+        raise ValueError("LLM response contains no JSON object")
+    data = json.loads(content[start:end + 1])  # Also skips ```json fences around the object
+    if not isinstance(data, dict) or not any(section in data for section in SECTIONS):
+        raise ValueError("LLM response does not follow the section schema")
+    sections = {}
+    for section in SECTIONS:
+        value = data.get(section)
+        if value is None:
+            value = ''
+        elif isinstance(value, list):
+            value = '; '.join(str(item) for item in value)
+        elif isinstance(value, dict):
+            value = json.dumps(value)
+        sections[section] = str(value).strip()
+    return sections
+
 
-    return response.text
+# Function to analyze a company's website and PDF text in one call, returning one value per section;
+# empty sources are left out of the prompt and nothing is sent when both are empty
+def Analyze_structured(website_text, pdf_text, max_attempts=5, use_cache=True, mode=None, pool=None, log_entry=None):
+    sources = [(name, text) for name, text in (('Website Text', website_text), ('PDF Text', pdf_text)) if text and text.strip()]
+    if not sources:
+        return {section: '' for section in SECTIONS}
+    text = '\n\n'.join(f"#### {name}:\n{source_text}" for name, source_text in sources)
+    if (mode or ANALYSIS_MODE) == 'map_reduce' and len(text) > CHUNK_TOKENS:
+        content = analyze_map_reduce(text, max_attempts, use_cache, single_template=json_template,
+                                     final_template=json_reduce_template, validate=parse_sections, pool=pool, log_entry=log_entry)
+    else:
+        content = analyze_text(json_template, text, max_attempts=max_attempts, use_cache=use_cache, validate=parse_sections,
+                               pool=pool)
+    return parse_sections(content)
@@ -0,0 +1,55 @@
+import os
+import shutil
+import tempfile
+import uuid
+
+# Text fields larger than this (in characters) are moved to disk while a profile waits in the pipeline
+SPILL_THRESHOLD = 64 * 1024
+SPILL_FIELDS = ('Website Text', 'PDF Text')
+
+
+# Placeholder left in a profile for a text field that lives on disk
+class SpilledText:
+    def __init__(self, path, length):
+        self.path = path
+        self.length = length
+
+    def load(self):
+        with open(self.path, encoding='utf-8') as file:
+            text = file.read()
+        os.remove(self.path)
+        return text
+
+
+# Per-run spill directory for large profile text fields
+class TextSpill:
+    def __init__(self, directory=None, threshold=SPILL_THRESHOLD):
+        self.directory = tempfile.mkdtemp(prefix='scrape_spill_', dir=directory)
+        self.threshold = threshold
+
+    # Move large text fields of a profile to disk (in place)
+    def spill(self, profile):
+        for field in SPILL_FIELDS:
+            text = profile.get(field)
+            if isinstance(text, str) and len(text) > self.threshold:
+                path = os.path.join(self.directory, uuid.uuid4().hex)
+                with open(path, 'w', encoding='utf-8') as file:
+                    file.write(text)
+                profile[field] = SpilledText(path, len(text))
+        return profile
+
+    # Bring spilled text fields back into the profile (in place)
+    def restore(self, profile):
+        for field in SPILL_FIELDS:
+            if isinstance(profile.get(field), SpilledText):
+                profile[field] = profile[field].load()
+        return profile
+
+    def close(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
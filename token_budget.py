@@ -0,0 +1,44 @@
+import re
+
+# Pre-tokenizer approximating the model's subword tokenizer: ASCII word runs cost about
+# one token per 4 characters, every other non-space character (punctuation, CJK, ...) one token
+_PIECE = re.compile(r'[A-Za-z0-9_]+|[^\sA-Za-z0-9_]')
+CHARS_PER_TOKEN = 4
+
+
+def _piece_tokens(piece):
+    return (len(piece) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+# Function to estimate the number of model tokens in a text
+def count_tokens(text):
+    return sum(_piece_tokens(match.group()) for match in _PIECE.finditer(text))
+
+
+# Function to cut a text to a token budget, scanning only as far as the budget reaches
+def truncate_to_token_budget(text, max_tokens):
+    if len(text) <= max_tokens:
+        return text  # Every token covers at least one character, so it already fits
+    used = 0
+    for match in _PIECE.finditer(text):
+        used += _piece_tokens(match.group())
+        if used > max_tokens:
+            return text[:match.start()].rstrip()
+    return text
+
+
+# Function to split a text into consecutive chunks of at most max_tokens each (cut between pieces)
+def split_by_token_budget(text, max_tokens):
+    chunks = []
+    start = 0
+    used = 0
+    for match in _PIECE.finditer(text):
+        tokens = _piece_tokens(match.group())
+        if used and used + tokens > max_tokens:
+            chunks.append(text[start:match.start()].strip())
+            start, used = match.start(), 0
+        used += tokens
+    tail = text[start:].strip()
+    if tail:
+        chunks.append(tail)
+    return chunks